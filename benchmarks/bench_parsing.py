@@ -0,0 +1,281 @@
+"""
+Micro-benchmarks for dump parsing, prompt extraction and element lookup.
+
+    python benchmarks/bench_parsing.py                    # run, compare with the saved baseline
+    python benchmarks/bench_parsing.py --save             # run and store the results as the baseline
+    python benchmarks/bench_parsing.py --scales 1 10 --filter lookup
+
+Every case runs over the recorded dumps (ui_dump.xml for profile screens, ui.xml for the
+compose screen) scaled synthetically to 1x-50x their node count. Reported per case: ops/sec
+(best of several timed rounds), peak resident memory one call adds, peak Python-heap memory
+during one call and the net number of memory blocks it leaves allocated. With a baseline
+present, the run exits with status 1 when any case's ops/sec drops by more than --threshold.
+
+The Python-heap peak comes from tracemalloc, which does not see memory libxml2 allocates, so
+it understates every lxml case; compare parsers by the RSS column. RSS is measured in a fresh
+process per case (Linux; elsewhere the column shows "-").
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import ctypes
+import subprocess
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils import actions, message_sender  # noqa: E402
+from utils.ui_snapshot import UiSnapshot, BOUNDS_RE  # noqa: E402
+from utils.prompt_matcher import PromptMatcher  # noqa: E402
+from utils.profile_assembler import visible_text_nodes  # noqa: E402
+from utils.fake_device import prompts_from_responses  # noqa: E402
+from utils.prompt_extractor import (  # noqa: E402
+    extract_prompt_response_pairs_from_xml, extract_prompts_from_multiple_xml)
+
+BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+PROFILE_DUMP = os.path.join(REPO_ROOT, "ui_dump.xml")
+COMPOSE_DUMP = os.path.join(REPO_ROOT, "ui.xml")
+RESPONSES_DIR = os.path.join(REPO_ROOT, "respones")
+DEFAULT_SCALES = (1, 5, 20, 50)
+DEFAULT_THRESHOLD = 0.25
+MIN_ROUND_TIME = 0.2
+ROUNDS = 3
+# The prompt on the recorded profile screen, so extraction has something to find
+SAMPLE_PROMPT = "My happy place"
+
+
+def scale_dump(xml, factor):
+    """
+    Returns `xml` with its top-level subtree repeated `factor` times, each copy shifted one
+    screen further down, like a profile that is `factor` screens long.
+    """
+    if factor == 1:
+        return xml
+    root = ET.fromstring(xml)
+    top = root[0]
+    height = int(BOUNDS_RE.match(top.attrib["bounds"]).group(4))
+    for copy_index in range(1, factor):
+        copy = ET.fromstring(ET.tostring(top))
+        for node in copy.iter("node"):
+            left, t, right, b = map(int, BOUNDS_RE.match(node.attrib["bounds"]).groups())
+            shift = copy_index * height
+            node.attrib["bounds"] = f"[{left},{t + shift}][{right},{b + shift}]"
+        root.append(copy)
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def known_prompts():
+    """Prompts from the saved prompt/response examples plus the one on the recorded screen."""
+    return {SAMPLE_PROMPT} | prompts_from_responses(RESPONSES_DIR)
+
+
+def build_cases(scales, workdir):
+    """Returns (name, scale, node_count, func) for every benchmark case."""
+    with open(PROFILE_DUMP, "rb") as f:
+        profile_xml = f.read()
+    with open(COMPOSE_DUMP, "rb") as f:
+        compose_xml = f.read()
+    prompts = known_prompts()
+    matcher = PromptMatcher(prompts)
+    prompts_file = os.path.join(workdir, "prompts.txt")
+    with open(prompts_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(sorted(prompts)))
+
+    cases = []
+    for scale in scales:
+        profile = scale_dump(profile_xml, scale)
+        compose = scale_dump(compose_xml, scale)
+        profile_snapshot = UiSnapshot.load(profile)
+        compose_snapshot = UiSnapshot.load(compose)
+        bounds = [node.attrib["bounds"] for node in profile_snapshot.nodes]
+        # A scroll pass worth of dumps on disk for the directory-based extractor
+        dump_dir = os.path.join(workdir, f"dumps_{scale}x")
+        os.makedirs(dump_dir)
+        for i in range(6):
+            with open(os.path.join(dump_dir, f"dump_{i + 1}.xml"), "wb") as f:
+                f.write(profile)
+
+        nodes = len(profile_snapshot.nodes)
+        compose_nodes = len(compose_snapshot.nodes)
+        cases += [
+            ("parse_bounds.regex", scale, nodes, lambda b=bounds: [actions.parse_bounds(s) for s in b]),
+            ("parse_bounds.split", scale, nodes, lambda b=bounds: [message_sender.parse_bounds(s) for s in b]),
+            ("parse.ui_snapshot", scale, nodes, lambda x=profile: UiSnapshot.load(x)),
+            ("parse.visible_text_nodes", scale, nodes, lambda x=profile: visible_text_nodes(x)),
+            ("extract.xml_set", scale, nodes, lambda x=profile: extract_prompt_response_pairs_from_xml(x, prompts)),
+            ("extract.xml_matcher", scale, nodes, lambda x=profile: extract_prompt_response_pairs_from_xml(x, matcher)),
+            ("extract.multiple_xml", scale, nodes * 6,
+             lambda d=dump_dir: extract_prompts_from_multiple_xml(d, prompts_file)),
+            ("lookup.like_buttons.xml", scale, nodes,
+             lambda x=profile: actions.get_button_coordinates_from_ui_dump(x, content_desc="Like")),
+            ("lookup.like_buttons.snapshot", scale, nodes,
+             lambda s=profile_snapshot: actions.get_button_coordinates_from_ui_dump(s, content_desc="Like")),
+            ("lookup.send.snapshot", scale, compose_nodes,
+             lambda s=compose_snapshot: actions.get_send_button_coordinates(s)),
+            ("lookup.cancel.snapshot", scale, compose_nodes,
+             lambda s=compose_snapshot: actions.get_cancel_button_coordinates(s)),
+        ]
+    return cases
+
+
+def measure(func, min_time=MIN_ROUND_TIME, rounds=ROUNDS):
+    """Returns (ops_per_sec, py_heap_peak_kib, net_blocks) for `func`; the peak misses native (libxml2) memory."""
+    func()  # warm caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+    best = elapsed
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    net_blocks = sys.getallocatedblocks() - blocks_before
+    return number / best, peak / 1024, net_blocks
+
+
+def _status_kib(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return None
+
+
+def rss_peak(func):
+    """
+    Peak resident memory (KiB) one call of `func` adds on top of what the process already holds,
+    native allocations included. Resets the kernel's high-water mark first, so it needs Linux;
+    returns None elsewhere.
+    """
+    func()  # lazy imports and caches are not the call's own cost
+    gc.collect()
+    try:
+        # Hand freed malloc pages back so the call has to fault in what it uses
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    try:
+        base = _status_kib("VmRSS")
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # reset VmHWM to the current RSS
+    except OSError:
+        return None
+    result = func()
+    peak = _status_kib("VmHWM")
+    del result
+    return max(0, peak - base)
+
+
+def rss_peak_in_subprocess(name, scale):
+    """Runs rss_peak for one case in a fresh interpreter, so earlier cases' heaps don't hide its cost."""
+    try:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--rss-case", name, "--scales", str(scale)],
+                                capture_output=True, text=True, timeout=300, check=True).stdout.split()
+        return int(output[-1]) if output and output[-1].isdigit() else None
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+
+def _rss_case(name, scale):
+    workdir = tempfile.mkdtemp(prefix="hinge-genie-bench-")
+    try:
+        for case_name, _, _, func in build_cases([scale], workdir):
+            if case_name == name:
+                peak = rss_peak(func)
+                print("-" if peak is None else peak)
+                return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="Dump size multipliers")
+    parser.add_argument("--filter", help="Only run cases whose name contains this")
+    parser.add_argument("--save", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file to compare against / save to")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed ops/sec drop versus the baseline before failing (0.25 = 25%%)")
+    parser.add_argument("--min-time", type=float, default=MIN_ROUND_TIME, help="Seconds per timed round")
+    parser.add_argument("--no-rss", action="store_true", help="Skip the per-case RSS measurement (one process each)")
+    parser.add_argument("--rss-case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.rss_case:
+        return _rss_case(args.rss_case, args.scales[0])
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved["results"]
+        if saved.get("python") != platform.python_version():
+            print(f"Note: baseline was recorded with Python {saved.get('python')}")
+
+    workdir = tempfile.mkdtemp(prefix="hinge-genie-bench-")
+    results = {}
+    regressions = []
+    try:
+        cases = build_cases(args.scales, workdir)
+        print(f"{'case':32} {'scale':>5} {'nodes':>7} {'ops/s':>12} {'RSS KiB':>9} {'py-heap KiB':>11} "
+              f"{'net blocks':>10}  vs baseline")
+        for name, scale, nodes, func in cases:
+            if args.filter and args.filter not in name:
+                continue
+            ops, peak_kib, net_blocks = measure(func, args.min_time)
+            rss_kib = None if args.no_rss else rss_peak_in_subprocess(name, scale)
+            key = f"{name}@{scale}x"
+            results[key] = {"ops_per_sec": ops, "rss_peak_kib": rss_kib, "py_heap_peak_kib": peak_kib,
+                            "net_blocks": net_blocks, "nodes": nodes}
+            change = ""
+            if key in baseline:
+                ratio = ops / baseline[key]["ops_per_sec"] - 1
+                change = f"{ratio:+.1%}"
+                if ratio < -args.threshold:
+                    regressions.append((key, ratio))
+                    change += "  REGRESSION"
+            rss = "-" if rss_kib is None else f"{rss_kib:,}"
+            print(f"{name:32} {scale:>4}x {nodes:>7} {ops:>12,.1f} {rss:>9} {peak_kib:>11.1f} {net_blocks:>10}  {change}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": platform.python_version(), "created": time.time(), "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}:")
+        for key, ratio in regressions:
+            print(f"  {key}: {ratio:+.1%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,150 @@
+import asyncio
 import logging
 import os
+import random
+import subprocess
 import yaml
 from utils.actions import find_and_interact_with_like_buttons, find_and_tap_skip_button, \
-    click_on_like_button_type_and_send_message, scroll_to_top, wait_random, scroll_and_save_ui_dumps
+    click_on_like_button_type_and_send_message, scroll_to_top
 
-from utils.interaction_manager import setup_history_folders, save_prompt_and_response
-from utils.llm import llm  
+from utils.interaction_manager import setup_history_folders, save_prompt_and_response, close_history
+from utils.llm import llm, DEFAULT_MAX_TOKENS
+from utils.llm_cache import get_cached_llm
+from utils.config import get_setting
+from utils.xml_engine import ParseError
+from utils.metrics import get_metrics, span, count
+from utils.seen_profiles import get_seen_profiles
+from utils.reply_selector import get_reply_selector, parse_candidates, DEFAULT_CANDIDATES
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
 
+GPT_PROMPT_INTRO = (
+    "You are an expert at writing witty and charming responses for Hinge, but your main goal is to sound authentic and easy to talk to. "
+)
+GPT_PROMPT_RULES = (
+    # NEW INSTRUCTION FOR SIMPLICITY
+    "Use simple, common English words and a conversational tone, as if you were texting a friend. Avoid complex vocabulary or formal phrasing. "
 
-def run_bot():
+    "Your tone should be inquisitive and playful. "
+    "Do not generalize specific details like decades or niche interests. "
+    "Crucially, your response must end with an open-ended question to make it easy to reply. "
+    "Be concise and avoid clichés. Do not use any emojis. Your response must be a maximum of 140 characters.\n\n"
+)
+GPT_PROMPT_TEMPLATE = (
+    GPT_PROMPT_INTRO +
+    "Given the following prompts from a user's profile, generate a single, engaging reply that increases the chances of a match. " +
+    GPT_PROMPT_RULES +
+    "Profile Prompts:\n{prompts}\n\n"
+    "Your Response (max 140 chars, simple English, must end with a question, no emoji):"
+)
+
+
+def prompt_template(candidates):
+    """The reply prompt template, asking for one reply or for `candidates` different ones as a JSON array."""
+    if candidates <= 1:
+        return GPT_PROMPT_TEMPLATE
+    return (
+        GPT_PROMPT_INTRO +
+        f"Given the following prompts from a user's profile, generate {candidates} different, engaging replies, "
+        "each of which could increase the chances of a match on its own. Every rule below applies to each reply. " +
+        GPT_PROMPT_RULES +
+        "Profile Prompts:\n{prompts}\n\n"
+        f"Your Responses (only a JSON array of {candidates} strings, each max 140 chars, simple English, "
+        "ending with a question, no emoji):"
+    )
+
+
+# Longest wait between failing cycles, as a multiple of the normal one
+MAX_BACKOFF_FACTOR = 8
+# What a bad dump or an unreachable device raise; any of them fails the cycle only
+CYCLE_ERRORS = (subprocess.SubprocessError, OSError, ValueError) + ParseError
+
+
+def generate_message(prompts, result):
+    """
+    Generates the reply for a profile, returning None if generation fails. One call asks for
+    several candidates; the best one by the reply rules is picked locally.
+    """
+    candidates = get_setting("gpt.candidates", DEFAULT_CANDIDATES)
+    template = prompt_template(candidates)
+    gpt_prompt = template.format(prompts=prompts)
+    with span("stage.generate") as record:
+        try:
+            max_tokens = get_setting("gpt.max_tokens", DEFAULT_MAX_TOKENS) * candidates
+            # Profiles the app re-shows (after restarts/refreshes) are answered from cache
+            raw = get_cached_llm().call(gpt_prompt, pairs=result, template=template, max_tokens=max_tokens)
+        except Exception as e:
+            logging.error(f"Failed to generate response: {str(e)}")
+            record["ok"] = False
+            return None
+        replies = parse_candidates(raw)
+        record["candidates"] = len(replies)
+        return get_reply_selector().select(replies)
+
+
+async def run_bot():
+    metrics = get_metrics()
+    metrics.start_cycle()
+    with span("cycle") as record:
+        record["sent"] = await _run_cycle()
+    # Refresh the Prometheus textfile once per cycle
+    metrics.export()
+
+
+async def _run_cycle():
+    """One bot cycle; returns whether a message was sent."""
     logging.info('Creating a new session for the bot...................................................................')
-    scroll_to_top()
+    # Device steps are blocking ADB round trips; run them off the event loop so the
+    # generation task below can make progress at the same time.
+    with span("stage.scroll_to_top"):
+        await asyncio.to_thread(scroll_to_top)
+
+    # Recognise a profile we've been through from its photo before any dump or LLM call is spent on it
+    seen_profiles = get_seen_profiles() if get_setting("seen_profiles.enabled", True) else None
+    profile_hash = None
+    if seen_profiles is not None:
+        with span("stage.seen_check") as record:
+            profile_hash = await asyncio.to_thread(seen_profiles.fingerprint)
+            distance = seen_profiles.match(profile_hash)
+            record["seen"] = distance is not None
+        if distance is not None:
+            logging.info(f"Profile already seen (photo hash {distance} bits off); skipping it.")
+            count("profiles.seen_skipped")
+            with span("stage.skip") as record:
+                record["ok"] = await asyncio.to_thread(find_and_tap_skip_button)
+            return False
+
+    # Build the LLM client in the background while the first screens are captured
+    if get_setting("gpt.warm_up", True):
+        llm.warm_up()
 
     # now extract all the prompt data from this -> using ocr
     message = None
-    scroll_and_save_ui_dumps()
-    from utils.prompt_extractor import extract_prompts_from_multiple_xml
-    result = extract_prompts_from_multiple_xml("history/tmp", "history/allPromts.txt")
+    from utils.prompt_matcher import get_prompt_matcher
+    from utils.capture_pipeline import capture_profile
+    with span("stage.capture") as record:
+        result = await asyncio.to_thread(capture_profile, get_prompt_matcher("history/allPromts.txt"))
+        record["pairs"] = len(result)
     logging.info(result)
-    scroll_to_top()
+    if seen_profiles is not None:
+        seen_profiles.add(profile_hash)
 
-    # result is a dict: {filename: [(prompt, answer), ...], ...}
+    # result is the profile's ordered, de-duplicated [(prompt, answer), ...]
     pairs = []
-    for file_results in result.values():
-        for prompt, answer in file_results:
+    for prompt, answer in result:
+        if answer:
             pairs.append(f"{prompt}: {answer}")
 
     prompts = "\n".join(pairs)
     logging.info(prompts)
 
-    gpt_prompt = (
-        "You are an expert at writing witty and charming responses for Hinge, but your main goal is to sound authentic and easy to talk to. "
-        "Given the following prompts from a user's profile, generate a single, engaging reply that increases the chances of a match. "
-        
-        # NEW INSTRUCTION FOR SIMPLICITY
-        "Use simple, common English words and a conversational tone, as if you were texting a friend. Avoid complex vocabulary or formal phrasing. "
-        
-        "Your tone should be inquisitive and playful. "
-        "Do not generalize specific details like decades or niche interests. "
-        "Crucially, your response must end with an open-ended question to make it easy to reply. "
-        "Be concise and avoid clichés. Do not use any emojis. Your response must be a maximum of 140 characters.\n\n"
-        f"Profile Prompts:\n{prompts}\n\n"
-        "Your Response (max 140 chars, simple English, must end with a question, no emoji):"
-    )
-
-    try:
-        message = llm.call(gpt_prompt)
-    except Exception as e:
-        logging.error(f"Failed to generate response: {str(e)}")
-        message = None
+    # Generate while the device scrolls back to the top; the message is only needed
+    # once we look for the like button.
+    generation = asyncio.create_task(asyncio.to_thread(generate_message, prompts, result))
+    with span("stage.scroll_back"):
+        await asyncio.to_thread(scroll_to_top)
+    with span("stage.await_generation"):
+        message = await generation
 
     if message:
         logging.info("\n" + "*" * 60)
@@ -61,29 +155,61 @@ def run_bot():
     if message:
         logging.info(f"[REQ FOUND] Sending message \n: {message}")
         # First find and click the reply button, passing the bio text to match
-        success, button_coords = find_and_interact_with_like_buttons(message)
+        with span("stage.like") as record:
+            success, button_coords = await asyncio.to_thread(find_and_interact_with_like_buttons, message)
+            record["ok"] = success
         if success and button_coords:
             logging.info(f"Found reply button at {button_coords}. Clicking and sending message...")
-            wait_random(0.5, 1)
+            await asyncio.sleep(random.uniform(0.5, 1))
             # Send the message
-            messageSent = click_on_like_button_type_and_send_message(message=message)
+            with span("stage.send") as record:
+                messageSent = await asyncio.to_thread(click_on_like_button_type_and_send_message, message=message)
+                record["ok"] = messageSent
             # Save profile and message to history
-            save_prompt_and_response(prompts, message)
+            save_prompt_and_response(prompts, message, sent=messageSent)
+            # Only replies that went out count as repeats later
+            if messageSent:
+                get_reply_selector().remember(message)
         else:
             logging.warning("Could not find matching reply button. Skipping message send.")
     else:
         logging.info('No suitable message found. Skipping.')
 
     if not messageSent:
-        find_and_tap_skip_button()
-  
+        with span("stage.skip") as record:
+            record["ok"] = await asyncio.to_thread(find_and_tap_skip_button)
+    return messageSent
+
+
+async def main():
+    logging.info("Bot starting up. Press Ctrl+C to stop.")
+    failures = 0
+    while True:
+        try:
+            await run_bot()
+            failures = 0
+        except CYCLE_ERRORS as e:
+            # A failed or truncated dump, or an adb timeout, costs the cycle, not the session
+            failures += 1
+            count("cycles.failed")
+            logging.error(f"Cycle failed ({failures} in a row): {e!r}")
+        wait_duration = random.uniform(10, 15)
+        if failures:
+            # Back off while the device keeps failing
+            wait_duration *= min(2 ** failures, MAX_BACKOFF_FACTOR)
+        logging.info(f"--- Cycle complete. Waiting for {wait_duration:.1f} seconds. ---")
+        await asyncio.sleep(wait_duration)
+
 
 if __name__ == "__main__":
     # Ensure all necessary folders exist before starting the loop
     setup_history_folders()
 
-    logging.info("Bot starting up. Press Ctrl+C to stop.")
-    while True:
-        run_bot()
-        wait_duration = wait_random(10, 15)
-        logging.info(f"--- Cycle complete. Waiting for {wait_duration} seconds. ---")
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("Stopping bot...")
+    finally:
+        # Write out any history still queued before exiting
+        close_history()
+        get_metrics().close()
@@ -1,56 +1,44 @@
 import os
 import time
 import logging
-import xml.etree.ElementTree as ET
-import xml.etree.ElementTree as ET
 import re
 import subprocess
-import time
-from xml.etree import ElementTree
-import logging
-import os
 import random
-from utils.interaction_manager import save_dump_to_history
-
+from utils.device import get_device
+from utils.interaction_manager import save_dump_to_history, save_dump_file, clear_dump_files, \
+    dump_archiving_enabled
+from utils.ui_snapshot import UiSnapshot
+from utils.xml_engine import ParseError
+from utils.screen_session import get_screen_session
+from utils.scroll_control import get_scroll_controller
+from utils.layout_cache import get_layout_cache
+from utils.metrics import span
+from utils.text_input import replace_field_text
+from utils.waits import wait_for_screen_stable, wait_for_element, wait_for_keyboard, keyboard_shown, \
+    screen_fingerprint, settled_fingerprint
+
+
+KEYCODE_BACK = 4
 
-# Configuration
-DUMP_FILE = "ui.xml"    
 # Setup basic loggingaa
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
 
 
+def _vision_locator():
+    # Imported on first use: template matching pulls in NumPy, which would slow every import of this module
+    from utils.vision_locator import get_vision_locator
+    return get_vision_locator()
+
+
 def find_and_interact_with_like_buttons(message=None):
     logging.info('Finding and clicking the first like button on screen...')
 
-    def take_screenshot(filename):
-        os.system(f"adb exec-out screencap -p > {filename}")
-        time.sleep(0.5)
-
     def scroll_screen_once():
-        os.system(f'adb shell input swipe 500 1500 500 800 300')
-        time.sleep(1.2)
-
-    def get_button_coordinates_from_ui_dump(xml_path, button_class="android.widget.Button", content_desc="Like"):
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        coords = []
-        for node in root.iter("node"):
-            if node.attrib.get("clickable") == "true":
-                if button_class and node.attrib.get("class") != button_class:
-                    continue
-                if content_desc and content_desc not in node.attrib.get("content-desc", ""):
-                    continue
-                bounds = node.attrib["bounds"]
-                left_top, right_bottom = bounds.split("][")
-                left, top = map(int, left_top[1:].split(","))
-                right, bottom = map(int, right_bottom[:-1].split(","))
-                x = (left + right) // 2
-                y = (top + bottom) // 2
-                coords.append((x, y))
-        return coords
+        get_device().shell('input swipe 500 1500 500 800 300')
+        wait_for_screen_stable(timeout=1.2)
 
     def click_button(x, y):
-        result = os.system(f"adb shell input tap {int(x)} {int(y)}")
+        result, _ = get_device().run(f"input tap {int(x)} {int(y)}")
         if result == 0:
             logging.info(f"✅ Tapped at ({x}, {y})")
             return True
@@ -59,17 +47,30 @@ def find_and_interact_with_like_buttons(message=None):
             return False
 
     try:
+        locator = _vision_locator()
         # Scroll once before capturing
         for _ in range(2):
-            # Dump UI hierarchy
-            os.system('adb shell uiautomator dump /sdcard/ui.xml')
-            os.system('adb pull /sdcard/ui.xml ui_dump.xml')
+            # A screen capture is much faster than a dump when the Like icon is already known;
+            # the match only counts if tapping it opened something
+            point = locator.locate("like")
+            if point:
+                before = screen_fingerprint()
+                if click_button(*point) and settled_fingerprint(timeout=1.5)[1] != before:
+                    return True, point
+                logging.warning("Tapping the matched Like icon changed nothing; looking it up in a dump")
+                locator.forget("like")
+
+            # Current UI hierarchy (only re-dumped if something was tapped or swiped since)
+            snapshot = get_screen_session().snapshot()
+            # Every profile dump also re-checks the cached Skip position
+            get_layout_cache().remember("profile", snapshot)
 
             # Find first like button
-            button_coords = get_button_coordinates_from_ui_dump('ui_dump.xml')
+            button_coords = get_button_coordinates_from_ui_dump(snapshot, content_desc="Like")
             if button_coords:
-                x, y = button_coords[0]
+                x, y = button_coords[0][:2]
                 logging.info(f"Found first button at ({x}, {y})")
+                locator.learn("like", button_coords[0][2:])
                 if click_button(x, y):
                     return True, (x, y)
             scroll_screen_once()
@@ -85,97 +86,33 @@ def find_and_interact_with_like_buttons(message=None):
 def adb_shell(cmd):
     """Executes an adb shell command and returns the output."""
     try:
-        return subprocess.run(["adb", "shell"] + cmd.split(), capture_output=True, text=True, check=True).stdout.strip()
+        return get_device().shell(cmd, check=True)
     except subprocess.CalledProcessError as e:
-        logging.error(f"ADB command failed: {e.stderr}")
-        return None
-
-def take_ui_dump():
-    """Dumps the current UI, saves it to history, and returns the local file path."""
-    logging.info("[*] Taking UIAutomator dump...")
-    adb_shell("uiautomator dump /sdcard/ui.xml")
-    subprocess.run(["adb", "pull", "/sdcard/ui.xml", DUMP_FILE], capture_output=True)
-    
-    if os.path.exists(DUMP_FILE):
-        # Save a copy to the history/dumps folder
-        save_dump_to_history(DUMP_FILE)
-        return DUMP_FILE
-    else:
-        logging.error("UI dump file not found after pull.")
+        logging.error(f"ADB command failed: {e.output}")
         return None
 
-def parse_bounds(bounds_str):
-    """Parses a bounds string like '[x1,y1][x2,y2]' into center (x, y) coordinates."""
-    match = re.match(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]", bounds_str)
-    if match:
-        x1, y1, x2, y2 = map(int, match.groups())
-        return (x1 + x2) // 2, (y1 + y2) // 2
-    return None, None
-
-def tap_screen(x, y):
-    """Taps the screen at the given coordinates."""
-    logging.info(f"[+] Tapping at ({x}, {y})...")
-    adb_shell(f"input tap {x} {y}")
-
-def find_and_tap_skip_button():
-    """Finds and taps the button to skip the current profile."""
-    logging.info("Attempting to find and tap the 'Skip' button.")
-    dump_path = take_ui_dump()
-    if not dump_path: return False
-
-    try:
-        tree = ElementTree.parse(dump_path)
-        root = tree.getroot()
-        
-        # --- MODIFIED PART ---
-        # Manually iterate to find the correct node instead of using complex XPath
-        skip_node = None
-        for node in root.iter('node'):
-            if (node.attrib.get('class') == 'android.widget.Button' and
-                    node.attrib.get('content-desc', '').startswith('Skip')):
-                skip_node = node
-                break  # Found the node, no need to search further
-        # --- END OF MODIFIED PART ---
-
-        if skip_node is not None:
-            logging.info(f"Found skip button with description: '{skip_node.attrib.get('content-desc')}'")
-            bounds = skip_node.attrib.get("bounds")
-            x, y = parse_bounds(bounds)
-            if x is not None and y is not None:
-                tap_screen(x, y)
-                logging.info("Successfully tapped the 'Skip' button.")
-                return True
-            else:
-                logging.error("Found skip button but could not parse its bounds.")
-        else:
-            logging.warning("Could not find the 'Skip' button on the screen.")
-
-    except ElementTree.ParseError:
-        logging.error("Failed to parse UI dump XML.")
-
-
-
-def take_screenshot(filename):
-    """Take a screenshot using ADB and save to filename."""
-    os.system(f"adb exec-out screencap -p > {filename}")
-    time.sleep(0.5)
-
 def scroll_screen(start_x=500, start_y=1500, end_x=500, end_y=800, duration=300, delay=1.2):
-    """Scroll the screen by swiping from (start_x, start_y) to (end_x, end_y)."""
-    os.system(f'adb shell input swipe {start_x} {start_y} {end_x} {end_y} {duration}')
-    time.sleep(delay)
+    """Scroll the screen by swiping from (start_x, start_y) to (end_x, end_y), then wait up to `delay` seconds for it to settle."""
+    get_device().shell(f'input swipe {start_x} {start_y} {end_x} {end_y} {duration}')
+    wait_for_screen_stable(timeout=delay)
 
 def take_ui_dump():
-    """Dumps the current UI, saves it to history, and returns the local file path."""
-    logging.info("[*] Taking UIAutomator dump...")
-    adb_shell("uiautomator dump /sdcard/ui.xml")
-    subprocess.run(["adb", "pull", "/sdcard/ui.xml", DUMP_FILE], capture_output=True)
-    if os.path.exists(DUMP_FILE):
-        save_dump_to_history(DUMP_FILE)
-        return DUMP_FILE
-    else:
-        logging.error("UI dump file not found after pull.")
+    """
+    Returns the current UI as raw XML bytes. The screen session's dump is reused if nothing
+    was sent to the device since it was taken; new dumps are archived if enabled.
+    """
+    session = get_screen_session()
+    dumps_before = session.stats["dumps"]
+    try:
+        ui_xml = session.xml()
+    except subprocess.SubprocessError as e:
+        logging.error(f"UI dump failed: {e}")
         return None
+    if session.stats["dumps"] != dumps_before:
+        logging.info("[*] Took UIAutomator dump")
+        if dump_archiving_enabled():
+            save_dump_to_history(ui_xml)
+    return ui_xml
 
 def parse_bounds(bounds_str):
     """Parses a bounds string like '[x1,y1][x2,y2]' into center (x, y) coordinates."""
@@ -190,24 +127,15 @@ def tap_screen(x, y):
     logging.info(f"[+] Tapping at ({x}, {y})...")
     adb_shell(f"input tap {x} {y}")
 
-def get_button_coordinates_from_ui_dump(xml_path, button_class="android.widget.Button", content_desc=None):
-    """Extracts coordinates of all clickable buttons from the UI dump XML. Optionally filter by class or content-desc."""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+def get_button_coordinates_from_ui_dump(ui_dump, button_class="android.widget.Button", content_desc=None):
+    """Extracts coordinates of all clickable buttons from the UI dump (snapshot, XML bytes or path). Optionally filter by class or content-desc."""
+    snapshot = UiSnapshot.load(ui_dump)
     coords = []
-    for node in root.iter("node"):
-        if node.attrib.get("clickable") == "true":
-            if button_class and node.attrib.get("class") != button_class:
-                continue
-            if content_desc and content_desc not in node.attrib.get("content-desc", ""):
-                continue
-            bounds = node.attrib["bounds"]
-            left_top, right_bottom = bounds.split("][")
-            left, top = map(int, left_top[1:].split(","))
-            right, bottom = map(int, right_bottom[:-1].split(","))
-            x = (left + right) // 2
-            y = (top + bottom) // 2
-            coords.append((x, y, left, top, right, bottom))
+    for node in snapshot.query("buttons", cls=button_class or "", desc=content_desc or ""):
+        left, top, right, bottom = snapshot.bounds(node)
+        x = (left + right) // 2
+        y = (top + bottom) // 2
+        coords.append((x, y, left, top, right, bottom))
     return coords
 
 
@@ -216,7 +144,7 @@ def click_button(x, y):
     try:
         adb_x = int(x)
         adb_y = int(y)
-        result = os.system(f"adb shell input tap {adb_x} {adb_y}")
+        result, _ = get_device().run(f"input tap {adb_x} {adb_y}")
         if result == 0:
             logging.info(f"Tapped at ({adb_x}, {adb_y}) using ADB")
             return True
@@ -227,67 +155,76 @@ def click_button(x, y):
         logging.error(f"Error during adb tap: {e}")
         return False
 
-def get_input_field_coordinates(xml_path):
-    """Extracts coordinates of the input field from the UI dump XML."""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for node in root.iter("node"):
-        if node.attrib.get("class") == "android.widget.EditText" and node.attrib.get("clickable") == "true":
-            return parse_bounds(node.attrib["bounds"])
+def get_input_field_coordinates(ui_dump):
+    """Extracts coordinates of the input field from the UI dump (snapshot, XML bytes or path)."""
+    snapshot = UiSnapshot.load(ui_dump)
+    nodes = snapshot.query("input_field")
+    if nodes:
+        return snapshot.center(nodes[0])
     return None, None
 
-def get_send_button_coordinates(xml_path):
-    """Extracts coordinates of the send button from the UI dump XML."""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for node in root.iter("node"):
-        content_desc = node.attrib.get("content-desc", "").lower()
-        if "send priority like" in content_desc:
-            for parent in root.iter("node"):
-                if node in list(parent):
-                    if parent.attrib.get("clickable") == "true":
-                        return parse_bounds(parent.attrib["bounds"])
+def get_send_button_coordinates(ui_dump):
+    """Extracts coordinates of the send button from the UI dump (snapshot, XML bytes or path)."""
+    snapshot = UiSnapshot.load(ui_dump)
+    # Clickable parents of the "send priority like" node
+    nodes = snapshot.query("send_button")
+    if nodes:
+        return snapshot.center(nodes[0])
     return None, None
 
-def get_cancel_button_coordinates(xml_path):
-    """Extracts coordinates of the cancel button from the UI dump XML."""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for node in root.iter("node"):
-        # Check both content-desc and text attributes
-        content_desc = node.attrib.get("content-desc", "").lower()
-        text = node.attrib.get("text", "").lower()
-        if content_desc == "cancel" or text == "cancel":
-            # If we found a text node, get its parent button
-            if node.attrib.get("class") == "android.widget.TextView":
-                for parent in root.iter("node"):
-                    if node in list(parent) and parent.attrib.get("class") == "android.widget.Button":
-                        return parse_bounds(parent.attrib["bounds"])
-            return parse_bounds(node.attrib["bounds"])
-    return None, None
+def get_cancel_button_coordinates(ui_dump):
+    """Extracts coordinates of the cancel button from the UI dump (snapshot, XML bytes or path)."""
+    snapshot = UiSnapshot.load(ui_dump)
+    # Check both content-desc and text attributes, whichever comes first in the tree
+    candidates = snapshot.query("cancel")
+    if not candidates:
+        return None, None
+    node = candidates[0]
+    # If we found a text node, get its parent button
+    if node.attrib.get("class") == "android.widget.TextView":
+        parent = snapshot.parent(node)
+        if parent is not None and parent.attrib.get("class") == "android.widget.Button":
+            return snapshot.center(parent)
+    return snapshot.center(node)
 
 
 def find_and_tap_skip_button():
     """Finds and taps the button to skip the current profile."""
     logging.info("Attempting to find and tap the 'Skip' button.")
-    dump_path = take_ui_dump()
-    if not dump_path: return False
+    cache = get_layout_cache()
+    cached = cache.center("profile", "skip")
+    if cached:
+        # The cached position counts only if tapping it moved on to another screen
+        before = screen_fingerprint()
+        tap_screen(*cached)
+        if settled_fingerprint(timeout=1.5)[1] != before:
+            logging.info("Tapped the 'Skip' button at its cached position.")
+            return True
+        cache.evict("profile", "skip")
+
+    locator = _vision_locator()
+    point = locator.locate("skip")
+    if point:
+        before = screen_fingerprint()
+        tap_screen(*point)
+        if settled_fingerprint(timeout=1.5)[1] != before:
+            logging.info("Tapped the 'Skip' button found on a screen capture.")
+            return True
+        logging.warning("Tapping the matched 'Skip' icon changed nothing; looking it up in a dump")
+        locator.forget("skip")
+
+    ui_xml = take_ui_dump()
+    if not ui_xml: return False
 
     try:
-        tree = ET.parse(dump_path)
-        root = tree.getroot()
-        
-        # Manually iterate to find the correct node instead of using complex XPath
-        skip_node = None
-        for node in root.iter('node'):
-            if (node.attrib.get('class') == 'android.widget.Button' and
-                    node.attrib.get('content-desc', '').startswith('Skip')):
-                skip_node = node
-                break  # Found the node, no need to search further
-        # --- END OF MODIFIED PART ---
+        snapshot = get_screen_session().snapshot()
+        cache.remember("profile", snapshot)
+        skip_nodes = snapshot.query("skip_button")
+        skip_node = skip_nodes[0] if skip_nodes else None
 
         if skip_node is not None:
             logging.info(f"Found skip button with description: '{skip_node.attrib.get('content-desc')}'")
+            locator.learn("skip", snapshot.bounds(skip_node))
             bounds = skip_node.attrib.get("bounds")
             x, y = parse_bounds(bounds)
             if x is not None and y is not None:
@@ -299,54 +236,102 @@ def find_and_tap_skip_button():
         else:
             logging.warning("Could not find the 'Skip' button on the screen.")
 
-    except ET.ParseError:
+    except ParseError:
         logging.error("Failed to parse UI dump for skip button.")
     
     return False
 
+def _cancel_coordinates(snapshot):
+    if snapshot is not None:
+        return get_cancel_button_coordinates(snapshot)
+    return get_layout_cache().center("compose", "cancel") or (None, None)
+
 def click_on_like_button_type_and_send_message(message):
+    snapshot = None
     try:
         logging.info('Preparing to send message...')
-        time.sleep(2)
-
-        logging.info('Dumping UI hierarchy to find input field...')
-        subprocess.run(['adb', 'shell', 'uiautomator', 'dump', '/sdcard/ui.xml'], check=True)
-        subprocess.run(['adb', 'pull', '/sdcard/ui.xml', 'ui_dump.xml'], check=True)
-        input_x, input_y = get_input_field_coordinates('ui_dump.xml')
-
-        if input_x is not None and input_y is not None:
-            logging.info(f'Found input field at ({input_x}, {input_y}). Tapping it...')
-            subprocess.run(["adb", "shell", "input", "tap", str(input_x), str(input_y)], check=True)
-            time.sleep(2.5)
-        else:
-            logging.error("Input field not found in UI dump.")
-            return False
+        cache = get_layout_cache()
+        locator = _vision_locator()
+        field = None
+
+        # Where the input field was last time: tap it without a dump, and let the keyboard
+        # coming up confirm the position
+        cached_field = cache.center("compose", "input_field")
+        if cached_field is not None:
+            wait_for_screen_stable(timeout=2)
+            input_x, input_y = cached_field
+            logging.info(f'Tapping input field at its cached position ({input_x}, {input_y})...')
+            get_device().shell(f"input tap {input_x} {input_y}", check=True)
+            if not wait_for_keyboard(timeout=2.5):
+                cache.evict("compose", "input_field")
+                cached_field = None
+
+        if cached_field is None:
+            logging.info('Waiting for the input field to appear...')
+            snapshot, field = wait_for_element(timeout=2, cls="android.widget.EditText", clickable=True)
+            cache.remember("compose", snapshot)
+            input_x, input_y = get_input_field_coordinates(snapshot)
+
+            if input_x is not None and input_y is not None:
+                logging.info(f'Found input field at ({input_x}, {input_y}). Tapping it...')
+                get_device().shell(f"input tap {input_x} {input_y}", check=True)
+                wait_for_keyboard(timeout=2.5)
+            else:
+                logging.error("Input field not found in UI dump.")
+                return False
 
-        safe_message = re.sub(r'[^\x00-\x7F]', '', message)
-        safe_message = re.sub(r'[\'\"\\\\`$&|;<>]', '', safe_message)
-        safe_message = safe_message.replace('\n', ' ').replace('\r', ' ')
-        safe_message = re.sub(r'\s+', ' ', safe_message).strip()
+        # Newlines would send early; everything else is typed as written
+        text = re.sub(r'\s+', ' ', message).strip()
 
-        if not safe_message:
-            logging.error("Message is empty after sanitization")
+        if not text:
+            logging.error("Message is empty")
             return False
 
-        logging.info(f'Clearing input field...')
-        subprocess.run(["adb", "shell", "input", "keyevent", "67"], check=True)  # Clear the input field
-        time.sleep(0.2)
-        max_length = 100
-        for i in range(0, len(safe_message), max_length):
-            chunk = safe_message[i:i+max_length]
-            chunk = chunk.replace(' ', '%s')
-            subprocess.run(["adb", "shell", "input", "text", chunk], check=True)
-            time.sleep(0.2)
-
-        send_x, send_y = get_send_button_coordinates('ui_dump.xml')
+        logging.info('Replacing input field text with the message...')
+        # Tapped at its cached position, the field was never dumped, so a draft in it has unknown length
+        replace_field_text(text, field.attrib.get("text", "") if field is not None else None)
+
+        wait_for_screen_stable(timeout=1)
+        # Cached position first, then where Send is on a capture, then where a dump has it.
+        # All three are taken with the keyboard up, where Send sits once text is typed.
+        cached_send = cache.center("compose_typed", "send")
+        point = cached_send or locator.locate("send")
+        if point is None:
+            snapshot = get_screen_session().snapshot()
+            cache.remember("compose_typed", snapshot)
+            send_nodes = snapshot.query("send_button")
+            if send_nodes:
+                # Learn the Send icon while the screen still matches this dump
+                locator.learn("send", snapshot.bounds(send_nodes[0]))
+            point = get_send_button_coordinates(snapshot)
+        send_x, send_y = point
 
         if send_x is not None and send_y is not None:
             logging.info(f'Tapping send button at ({send_x}, {send_y})...')
-            time.sleep(1)
-            subprocess.run(["adb", "shell", "input", "tap", str(send_x), str(send_y)], check=True)
+            get_device().shell(f"input tap {send_x} {send_y}", check=True)
+            if cached_send is not None:
+                wait_for_screen_stable(timeout=1.5)
+            if cached_send is not None and keyboard_shown():
+                # Still composing: the cached position missed and may have hit the keyboard. Hide
+                # it so the retry can't land on a key, then look Send up in a fresh dump (which is
+                # not cached: Send only sits at its cached position with the keyboard up)
+                cache.evict("compose_typed", "send")
+                get_device().shell(f"input keyevent {KEYCODE_BACK}", check=True)
+                wait_for_screen_stable(timeout=1)
+                snapshot = get_screen_session().refresh_snapshot()
+                fields = snapshot.query("input_field")
+                if fields and fields[0].attrib.get("text", "").strip() != text:
+                    logging.error("The missed Send tap changed the message; closing the dialog instead of sending it.")
+                    cancel_x, cancel_y = _cancel_coordinates(snapshot)
+                    if cancel_x is not None:
+                        get_device().shell(f"input tap {cancel_x} {cancel_y}", check=True)
+                    return False
+                send_x, send_y = get_send_button_coordinates(snapshot)
+                if send_x is None:
+                    logging.error("Send button not found.")
+                    return False
+                logging.info(f'Tapping send button at ({send_x}, {send_y})...')
+                get_device().shell(f"input tap {send_x} {send_y}", check=True)
             return True
         else:
             logging.error("Send button not found.")
@@ -355,19 +340,19 @@ def click_on_like_button_type_and_send_message(message):
     except subprocess.CalledProcessError as e:
         logging.error(f"ADB command failed: {e}")
         # Attempt to close the dialog by clicking the cancel button
-        cancel_x, cancel_y = get_cancel_button_coordinates('ui_dump.xml')
+        cancel_x, cancel_y = _cancel_coordinates(snapshot)
         if cancel_x is not None and cancel_y is not None:
             logging.info(f'Attempting to close dialog by tapping cancel button at ({cancel_x}, {cancel_y})...')
-            subprocess.run(["adb", "shell", "input", "tap", str(cancel_x), str(cancel_y)], check=True)
+            get_device().shell(f"input tap {cancel_x} {cancel_y}", check=True)
             return False
         else:
             logging.error("Cancel button not found.")
             return False
     except Exception as e:
-        cancel_x, cancel_y = get_cancel_button_coordinates('ui_dump.xml')
+        cancel_x, cancel_y = _cancel_coordinates(snapshot)
         if cancel_x is not None and cancel_y is not None:
             logging.info(f'Attempting to close dialog by tapping cancel button at ({cancel_x}, {cancel_y})...')
-            subprocess.run(["adb", "shell", "input", "tap", str(cancel_x), str(cancel_y)], check=True)
+            get_device().shell(f"input tap {cancel_x} {cancel_y}", check=True)
             return False
         else:
             logging.error("Cancel button not found.")
@@ -375,38 +360,49 @@ def click_on_like_button_type_and_send_message(message):
 
 def scroll_to_top():
     logging.info('Scrolling to the top before starting full page screenshot capture...')
-    # Scroll to the top by sending multiple swipe-up gestures
-    for _ in range(8):
-        # Swipe up: start_y < end_y (move from lower to upper part of the screen)
-        os.system('adb shell input swipe 500 800 500 1500 300')
-        time.sleep(0.5)
-    logging.info('Reached top of the page.')
-
-def scroll_and_save_ui_dumps(folder_path=None, scroll_count=6, delay=1.2):
+    # Swipe up until a swipe no longer changes the screen
+    swipes = get_scroll_controller().scroll_to_top()
+    logging.info(f'Reached top of the page after {swipes} swipe(s).')
+
+def scroll_and_save_ui_dumps(folder_path=None, max_dumps=None, delay=1.2, on_dump=None):
     """
-    Scrolls the screen `scroll_count` times, taking a UI dump after each scroll and saving
-    each dump as an XML file in `folder_path` (default: 'history/tmp'). Dumps are named dump_1.xml, dump_2.xml, ...
+    Scrolls through the profile, taking a UI dump after each scroll, until a swipe leaves the
+    screen unchanged (end of the profile) or `max_dumps` dumps were taken. Dumps are
+    streamed straight into memory; when history archiving is enabled each one is also queued
+    to be saved by the history writer as an XML file in `folder_path` (default: 'history/tmp'), named dump_1.xml, dump_2.xml, ...,
+    replacing the previous profile's dumps there.
     Args:
         folder_path (str): Directory to save UI dump XML files.
-        scroll_count (int): Number of scrolls/UI dumps to perform.
-        delay (float): Seconds to wait after each scroll before dumping UI.
+        max_dumps (int): Most dumps to take (default: scroll.max_dumps in config.yaml).
+        delay (float): Longest wait for the screen to settle after each scroll before dumping UI.
+        on_dump (callable): Called as on_dump(index, xml_bytes) as soon as each dump arrives,
+            before the next swipe, so consumers can start processing it right away.
+    Returns:
+        List of raw XML bytes, one per dump, in capture order.
     """
     if folder_path is None:
         folder_path = os.path.join('history', 'tmp')
-    os.makedirs(folder_path, exist_ok=True)
-    for i in range(scroll_count):
-        # Dump UI
-        dump_name = os.path.join(folder_path, f"dump_{i+1}.xml")
-        os.system('adb shell uiautomator dump /sdcard/ui.xml')
-        os.system(f'adb pull /sdcard/ui.xml "{dump_name}"')
-        logging.info(f"Saved UI dump: {dump_name}")
-        # Scroll screen
-        os.system('adb shell input swipe 500 1500 500 800 300')
-        time.sleep(delay)
+    archive = dump_archiving_enabled()
+    if archive:
+        os.makedirs(folder_path, exist_ok=True)
+        # The dump count varies per profile; a longer previous profile must not leave pages behind
+        clear_dump_files(folder_path)
+    dumps = []
+
+    def handle_dump(i, ui_xml):
+        dumps.append(ui_xml)
+        if on_dump is not None:
+            on_dump(i, ui_xml)
+        if archive:
+            save_dump_file(os.path.join(folder_path, f"dump_{i+1}.xml"), ui_xml)
+
+    get_scroll_controller().capture(handle_dump, max_dumps, delay)
+    return dumps
 
 
 def wait_random(min_seconds=2, max_seconds=5):
-    time.sleep(random.uniform(min_seconds, max_seconds))
+    with span("wait.random"):
+        time.sleep(random.uniform(min_seconds, max_seconds))
 
 
 
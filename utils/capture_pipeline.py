@@ -0,0 +1,54 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.actions import scroll_and_save_ui_dumps
+from utils.prompt_extractor import extract_prompt_response_pairs
+from utils.profile_assembler import visible_text_nodes, merge_windows, dedupe_pairs, scroll_offsets
+from utils.scroll_control import get_scroll_controller
+from utils.metrics import span
+
+# Parsing a dump takes far less time than a swipe, so a couple of workers keep up easily
+PARSE_WORKERS = 2
+
+
+def _parse_window(ui_xml):
+    with span("capture.parse", size=len(ui_xml)):
+        return visible_text_nodes(ui_xml)
+
+
+def capture_profile(known_prompts, folder_path=None, max_dumps=None, delay=1.2, workers=PARSE_WORKERS):
+    """
+    Scrolls through the current profile and returns its assembled prompt/answer pairs.
+
+    The device loop is the producer: every dump is handed to a worker pool the moment it
+    arrives and parsed there while the device swipes and waits for the next screen. By the
+    time the last swipe lands, all but the final window are already parsed, so only the
+    (cheap) window merge is left instead of a separate parse phase.
+    Args:
+        known_prompts (set): Set of known prompt strings.
+        folder_path (str): Where dumps are archived, see scroll_and_save_ui_dumps.
+        max_dumps (int): Most dumps to take, see scroll_and_save_ui_dumps.
+        delay (float): Longest wait for the screen to settle after each scroll before dumping UI.
+        workers (int): Number of parser threads.
+    Returns:
+        Ordered list of unique (prompt, answer) tuples.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dump-parser") as pool:
+        futures = []
+
+        def on_dump(index, ui_xml):
+            futures.append(pool.submit(_parse_window, ui_xml))
+
+        scroll_and_save_ui_dumps(folder_path, max_dumps, delay, on_dump=on_dump)
+
+        windows = []
+        for index, future in enumerate(futures):
+            try:
+                windows.append(future.result())
+            except Exception as e:
+                logging.error(f"Failed to parse dump {index + 1}: {e}")
+    # How far each swipe moved the content tunes the next profile's swipe length
+    if len(windows) == len(futures):
+        get_scroll_controller().learn(scroll_offsets(windows))
+    with span("capture.assemble", windows=len(windows)):
+        texts = merge_windows(windows)
+        return dedupe_pairs(extract_prompt_response_pairs(texts, known_prompts))
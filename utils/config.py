@@ -0,0 +1,29 @@
+import os
+
+CONFIG_FILE = os.environ.get("HINGE_GENIE_CONFIG", "config.yaml")
+
+_config = None
+
+
+def load_config():
+    """Loads config.yaml once per process and returns it as a dict."""
+    global _config
+    if _config is None:
+        import yaml  # only needed once, keep it off the import path of every utils module
+
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                _config = yaml.safe_load(f) or {}
+        else:
+            _config = {}
+    return _config
+
+
+def get_setting(path, default=None):
+    """Looks up a dotted key such as 'history.archive_dumps' in the config."""
+    value = load_config()
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    return value
@@ -0,0 +1,215 @@
+import os
+import queue
+import atexit
+import logging
+import subprocess
+import threading
+from utils.metrics import span
+
+# Configuration
+ADB_PATH = os.environ.get("ADB", "adb")
+DEFAULT_TIMEOUT = 30
+# Marker echoed after every command so we know where its output ends
+SENTINEL = "__HINGE_GENIE_DONE__"
+UI_DUMP_REMOTE_PATH = "/sdcard/ui.xml"
+# Shell commands that change what is on screen (taps, swipes, text, intents)
+SCREEN_CHANGING_COMMANDS = ("input", "am")
+
+
+class AdbDevice:
+    """
+    Drives one Android device through a single long-lived `adb shell` process.
+
+    Commands are written to the shell's stdin and their output is read back up to
+    a sentinel line carrying the exit code, so a tap or swipe costs one round trip
+    over an already open connection instead of a fresh adb client. If the session
+    dies (device unplugged, adb server restarted) it is re-opened on the next call.
+
+    `generation` is bumped whenever a command that changes the screen is sent, so
+    anything caching screen state can tell whether it is still current.
+    """
+
+    def __init__(self, serial=None, adb_path=ADB_PATH, timeout=DEFAULT_TIMEOUT):
+        self.serial = serial
+        self.adb_path = adb_path
+        self.timeout = timeout
+        self._proc = None
+        self._lines = None
+        self._seq = 0
+        self._lock = threading.RLock()
+        self.generation = 0
+
+    def adb_command(self, *args):
+        """Returns the argv for a one-off adb invocation against this device."""
+        cmd = [self.adb_path]
+        if self.serial:
+            cmd += ["-s", self.serial]
+        return cmd + list(args)
+
+    def _start(self):
+        logging.info("[adb] Opening persistent shell session...")
+        self._proc = subprocess.Popen(
+            self.adb_command("shell"),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc, lines):
+        """Moves shell output lines into a queue so reads can time out."""
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def close(self):
+        """Terminates the shell session, if one is open."""
+        with self._lock:
+            if self._proc is None:
+                return
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+            self._lines = None
+
+    def _exchange(self, cmd, timeout):
+        self._seq += 1
+        marker = f"{SENTINEL}{self._seq}:"
+        # The subshell keeps a stray `exit` from ending the session, and the
+        # redirect stops a command from swallowing the next one from our pipe.
+        self._proc.stdin.write(f"( {cmd}\n) </dev/null 2>&1; echo {marker}$?\n")
+        self._proc.stdin.flush()
+
+        output = []
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                # The reply may still arrive later and desync the stream; start over.
+                self.close()
+                raise subprocess.TimeoutExpired(cmd, timeout, output="".join(output))
+            if line is None:
+                raise ConnectionError("adb shell session closed")
+            idx = line.find(marker)
+            if idx >= 0:
+                output.append(line[:idx])
+                return int(line[idx + len(marker):].strip() or 1), "".join(output).replace("\r", "")
+            output.append(line)
+
+    def run(self, cmd, timeout=None):
+        """Runs `cmd` in the device shell and returns (exit_code, output)."""
+        timeout = timeout or self.timeout
+        program = cmd.split(None, 1)[0] if cmd.strip() else ""
+        with self._lock, span(f"adb.shell.{program}") as record:
+            if program in SCREEN_CHANGING_COMMANDS:
+                self.generation += 1
+            for attempt in range(2):
+                if not self._alive():
+                    self._start()
+                try:
+                    code, output = self._exchange(cmd, timeout)
+                    record["ok"] = code == 0
+                    record["bytes"] = len(output)
+                    return code, output
+                except (OSError, ConnectionError) as e:
+                    logging.warning(f"[adb] Shell session lost ({e}), reconnecting...")
+                    record["reconnects"] = attempt + 1
+                    self.close()
+                    if attempt:
+                        raise
+
+    def shell(self, cmd, check=False, timeout=None):
+        """Runs `cmd` in the device shell and returns its stripped output.
+
+        With `check=True` a non-zero exit raises subprocess.CalledProcessError,
+        like subprocess.run(..., check=True) did for the old one-shot calls.
+        """
+        code, output = self.run(cmd, timeout=timeout)
+        if check and code != 0:
+            raise subprocess.CalledProcessError(code, cmd, output=output)
+        return output.strip()
+
+    def exec_out(self, *args, timeout=None):
+        """Runs a command through `adb exec-out` and returns its raw stdout bytes."""
+        with span(f"adb.exec_out.{args[0]}") as record:
+            result = subprocess.run(self.adb_command("exec-out", *args), capture_output=True,
+                                    timeout=timeout or self.timeout, check=True)
+            record["bytes"] = len(result.stdout)
+            return result.stdout
+
+    def dump_ui(self, timeout=None):
+        """Returns the current UI hierarchy as XML bytes, without touching /sdcard or the host disk.
+
+        The dump is streamed over `exec-out` by pointing uiautomator at /dev/tty. Builds
+        that refuse /dev/tty fall back to dumping to /sdcard and cat'ing it over the open
+        shell session, which still avoids a separate `adb pull`.
+        """
+        with span("adb.dump_ui") as record:
+            try:
+                raw = self.exec_out("uiautomator", "dump", "/dev/tty", timeout=timeout)
+            except subprocess.CalledProcessError:
+                raw = b""
+            start = raw.find(b"<?xml")
+            end = raw.rfind(b"</hierarchy>")
+            if start >= 0 and end >= 0:
+                record["bytes"] = end + len(b"</hierarchy>") - start
+                return raw[start:end + len(b"</hierarchy>")]
+
+            logging.warning("[adb] Streaming UI dump failed, falling back to /sdcard dump.")
+            record["fallback"] = True
+            output = self.shell(f"uiautomator dump {UI_DUMP_REMOTE_PATH} >/dev/null && cat {UI_DUMP_REMOTE_PATH}",
+                                check=True, timeout=timeout)
+            record["bytes"] = len(output)
+            return output.encode("utf-8")
+
+    def pull(self, remote_path, local_path, timeout=None):
+        """Copies a file from the device to the host."""
+        with span("adb.pull") as record:
+            subprocess.run(self.adb_command("pull", remote_path, local_path), capture_output=True,
+                           timeout=timeout or self.timeout, check=True)
+            record["bytes"] = os.path.getsize(local_path)
+
+
+_device = None
+
+
+def get_device():
+    """Returns the process-wide device, opening it on first use."""
+    global _device
+    if _device is None:
+        replay = os.environ.get("HINGE_GENIE_REPLAY")
+        if replay:
+            # Recorded dumps instead of a phone, see utils/fake_device.py
+            from utils.fake_device import ReplayDevice
+            _device = ReplayDevice.from_env(replay)
+        else:
+            _device = AdbDevice(serial=os.environ.get("ANDROID_SERIAL"))
+    return _device
+
+
+def set_device(device):
+    """Replaces the process-wide device (e.g. to target another serial)."""
+    global _device
+    if _device is not None and _device is not device:
+        _device.close()
+    _device = device
+
+
+@atexit.register
+def _close_device():
+    if _device is not None:
+        _device.close()
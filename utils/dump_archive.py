@@ -0,0 +1,182 @@
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from utils.config import get_setting
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used instead
+    zstandard = None
+
+ARCHIVE_DIR = os.path.join("history", "archive")
+DEFAULT_MAX_MB = 200
+DEFAULT_MAX_AGE_DAYS = 30
+# Retention is checked on open and then every this many stored dumps
+RETENTION_EVERY = 50
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    kind TEXT NOT NULL,
+    label TEXT,
+    digest TEXT NOT NULL REFERENCES blobs (digest)
+);
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+"""
+
+
+def _compress(data, codec):
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, codec):
+    if codec == "zst":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class DumpArchive:
+    """
+    Content-addressed, compressed store for UI dumps.
+
+    Each distinct dump is stored once under objects/<aa>/<sha256>.<codec>, zstd-compressed
+    when the zstandard package is installed and gzip otherwise. A small sqlite manifest
+    records every archived occurrence (time, kind, label, digest), so a screen captured
+    again only costs a manifest row. Entries past `max_age_days` are dropped, then the
+    oldest ones until the blobs fit in `max_bytes`; blobs nothing refers to are deleted.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        self.codec = "zst" if zstandard is not None else "gz"
+        self._lock = threading.Lock()
+        self._puts = 0
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "manifest.sqlite3"), check_same_thread=False)
+        self._db.executescript(MANIFEST_SCHEMA)
+        self.enforce_retention()
+
+    def blob_path(self, digest, codec):
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.xml.{codec}")
+
+    def put(self, dump, kind="dump", label=None):
+        """
+        Archives a dump given as XML bytes or a file path and returns the blob path.
+        Identical content is written only once.
+        """
+        if not isinstance(dump, bytes):
+            with open(dump, "rb") as f:
+                dump = f.read()
+        digest = hashlib.sha256(dump).hexdigest()
+        with self._lock:
+            row = self._db.execute("SELECT codec FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                codec = self.codec
+                path = self.blob_path(digest, codec)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                compressed = _compress(dump, codec)
+                # Write-then-rename so a crash never leaves a truncated blob under its final name
+                with open(path + ".tmp", "wb") as f:
+                    f.write(compressed)
+                os.replace(path + ".tmp", path)
+                self._db.execute("INSERT INTO blobs (digest, codec, size, stored_size) VALUES (?, ?, ?, ?)",
+                                 (digest, codec, len(dump), len(compressed)))
+            else:
+                codec = row[0]
+            self._db.execute("INSERT INTO entries (created, kind, label, digest) VALUES (?, ?, ?, ?)",
+                             (time.time(), kind, label, digest))
+            self._db.commit()
+            self._puts += 1
+            check_retention = self._puts % RETENTION_EVERY == 0
+        if check_retention:
+            self.enforce_retention()
+        return self.blob_path(digest, codec)
+
+    def get(self, digest):
+        """Returns the original XML bytes of an archived dump."""
+        with self._lock:
+            row = self._db.execute("SELECT codec FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        with open(self.blob_path(digest, row[0]), "rb") as f:
+            return _decompress(f.read(), row[0])
+
+    def entries(self, kind=None, limit=None):
+        """Returns (created, kind, label, digest) manifest rows, newest first."""
+        sql = "SELECT created, kind, label, digest FROM entries"
+        params = []
+        if kind:
+            sql += " WHERE kind = ?"
+            params.append(kind)
+        sql += " ORDER BY created DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def stored_bytes(self):
+        with self._lock:
+            return self._db.execute("SELECT IFNULL(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+
+    def enforce_retention(self):
+        """Drops expired and excess entries, then deletes blobs no entry refers to."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.max_age,))
+            total = self._db.execute("SELECT IFNULL(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+            while total > self.max_bytes:
+                # Drop the oldest tenth of the entries per round rather than one row at a time
+                count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                if not count:
+                    break
+                self._db.execute("DELETE FROM entries WHERE id IN (SELECT id FROM entries ORDER BY created LIMIT ?)",
+                                 (max(1, count // 10),))
+                total = self._collect_garbage()
+            self._collect_garbage()
+            self._db.commit()
+
+    def _collect_garbage(self):
+        orphans = self._db.execute(
+            "SELECT digest, codec FROM blobs WHERE digest NOT IN (SELECT DISTINCT digest FROM entries)").fetchall()
+        for digest, codec in orphans:
+            try:
+                os.remove(self.blob_path(digest, codec))
+            except FileNotFoundError:
+                pass
+        if orphans:
+            self._db.executemany("DELETE FROM blobs WHERE digest = ?", [(digest,) for digest, _ in orphans])
+            logging.info(f"Dump archive: removed {len(orphans)} unreferenced blobs")
+        return self._db.execute("SELECT IFNULL(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_dump_archive():
+    """Returns the process-wide dump archive, opening it on first use."""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = DumpArchive(
+                root=get_setting("history.archive.path", ARCHIVE_DIR),
+                max_bytes=get_setting("history.archive.max_mb", DEFAULT_MAX_MB) * 1024 * 1024,
+                max_age_days=get_setting("history.archive.max_age_days", DEFAULT_MAX_AGE_DAYS),
+            )
+        return _archive
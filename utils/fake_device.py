@@ -0,0 +1,359 @@
+"""
+Offline replay device: runs the bot against recorded UI dumps with no phone attached.
+
+    HINGE_GENIE_REPLAY=1 python main.py
+    HINGE_GENIE_REPLAY=history/tmp:ui_dump.xml python main.py
+    python -m utils.fake_device --cycles 5 --latency-scale 0 --json cycle_bench.json
+
+Each source is one recorded profile: a directory of dump_N.xml scroll pages (like
+history/tmp) or a single dump file. `archive` replays the dumps in history/archive. Set
+`gpt.backend: stub` to run without an LLM; --cycles does that by itself and times whole
+bot cycles in a scratch directory.
+"""
+import os
+import re
+import sys
+import time
+import json
+import shlex
+import base64
+import random
+import shutil
+import asyncio
+import hashlib
+import logging
+import argparse
+import tempfile
+import statistics
+from xml.sax.saxutils import quoteattr
+from utils.device import SCREEN_CHANGING_COMMANDS
+from utils.metrics import span, get_metrics
+from utils.ui_snapshot import UiSnapshot
+from utils.prompt_extractor import dump_sort_key
+
+COMPOSE_DUMP = "ui.xml"
+PROFILE_DUMP = "ui_dump.xml"
+DEFAULT_SOURCES = (os.path.join("history", "tmp"), PROFILE_DUMP)
+# Rough per-command costs on a real phone, in seconds
+DEFAULT_LATENCIES = {"dump": 1.5, "input": 0.05, "screencap": 0.15, "shell": 0.02}
+# Header and 1x1 pixel, enough for anything that only saves the bytes
+BLANK_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=")
+
+
+def load_profiles(sources):
+    """Reads each source (directory of scroll pages, single dump file, or 'archive') into lists of XML pages."""
+    profiles = []
+    for source in sources:
+        if source == "archive":
+            from utils.dump_archive import get_dump_archive
+            archive = get_dump_archive()
+            profiles.extend([archive.get(digest)] for _, _, _, digest in archive.entries(kind="dump"))
+        elif os.path.isdir(source):
+            names = sorted((n for n in os.listdir(source) if n.endswith(".xml")), key=dump_sort_key)
+            pages = []
+            for name in names:
+                with open(os.path.join(source, name), "rb") as f:
+                    pages.append(f.read())
+            if pages:
+                profiles.append(pages)
+        elif os.path.isfile(source):
+            with open(source, "rb") as f:
+                profiles.append([f.read()])
+    return profiles
+
+
+def load_compose(path=COMPOSE_DUMP):
+    """
+    The recorded compose screen, or None. The recording labels its button "Send like"; the bot
+    only taps "Send priority like", so the label is replayed as that.
+    """
+    compose = load_profiles([path])
+    if not compose:
+        return None
+    return compose[0][0].replace(b'content-desc="Send like"', b'content-desc="Send priority like"')
+
+
+class ReplayDevice:
+    """
+    Stands in for AdbDevice by replaying recorded dumps as a small state machine.
+
+    Swiping moves between a profile's pages, tapping Like opens the compose dump, Cancel
+    closes it, and Skip or Send move on to the next recorded profile. Typed text and sent
+    messages are recorded. Every command sleeps for its entry in `latencies` times
+    `latency_scale` (swipes also for their gesture duration), so a scale of 0 runs as fast
+    as the host allows.
+    """
+
+    def __init__(self, profiles, compose=None, latencies=None, latency_scale=1.0):
+        if not profiles:
+            raise ValueError("ReplayDevice needs at least one recorded profile")
+        self.serial = "replay"
+        self.profiles = profiles
+        self.compose = compose
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.latency_scale = latency_scale
+        self.generation = 0
+        self.counts = {}
+        self.sent = []
+        self.typed = ""
+        self.profile = 0
+        self.page = 0
+        self.composing = False
+        self.keyboard = False
+        self._snapshots = {}
+        self._typed_compose = {}
+
+    @classmethod
+    def from_env(cls, value):
+        """Builds a device from HINGE_GENIE_REPLAY: '1' for the default recordings, else os.pathsep-separated sources."""
+        sources = DEFAULT_SOURCES if value in ("1", "true", "yes") else value.split(os.pathsep)
+        return cls(load_profiles(sources), compose=load_compose(),
+                   latency_scale=float(os.environ.get("HINGE_GENIE_REPLAY_LATENCY_SCALE", 1.0)))
+
+    def _sleep(self, kind, extra=0.0):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        delay = (self.latencies.get(kind, 0.0) + extra) * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+
+    def current_xml(self):
+        if self.composing and self.compose is not None:
+            if not self.typed:
+                return self.compose
+            # The field shows what was typed, like a real dump
+            xml = self._typed_compose.get(self.typed)
+            if xml is None:
+                field = re.compile(rb'(<node[^>]*?) text="[^"]*"([^>]*class="android\.widget\.EditText")')
+                value = quoteattr(self.typed).encode("utf-8")
+                xml = self._typed_compose[self.typed] = field.sub(lambda m: m.group(1) + b" text=" + value + m.group(2),
+                                                                  self.compose, count=1)
+            return xml
+        return self.profiles[self.profile][self.page]
+
+    def _snapshot(self, xml):
+        snapshot = self._snapshots.get(id(xml))
+        if snapshot is None:
+            snapshot = self._snapshots[id(xml)] = UiSnapshot.load(xml)
+        return snapshot
+
+    def _next_profile(self):
+        self.profile = (self.profile + 1) % len(self.profiles)
+        self.page = 0
+        self.composing = self.keyboard = False
+        self.typed = ""
+
+    def _tap(self, x, y):
+        snapshot = self._snapshot(self.current_xml())
+        hits = []
+        for node in snapshot.nodes:
+            left, top, right, bottom = snapshot.bounds(node)
+            if left <= x < right and top <= y < bottom:
+                hits.append(((right - left) * (bottom - top), -snapshot.index(node), node))
+        if not hits:
+            return
+        # The smallest node under the finger, then its ancestors
+        node = min(hits, key=lambda hit: hit[:2])[2]
+        chain = []
+        while node is not None:
+            chain.append(node)
+            node = snapshot.parent(node)
+        # The nearest clickable ancestor takes the tap; it is labelled by whatever it shows under
+        # the finger, so siblings of the hit node (a Send button's label) count too
+        target = next((n for n in chain if n.attrib.get("clickable") == "true"), None)
+        under_finger = {id(hit[2]) for hit in hits}
+        if target is not None:
+            chain += [n for n in target.iter() if id(n) in under_finger and n not in chain]
+        labels = [(n.attrib.get("content-desc") or n.attrib.get("text") or "").lower() for n in chain]
+        classes = [n.attrib.get("class") for n in chain]
+        if "android.widget.EditText" in classes:
+            self.keyboard = True
+        elif any(label.startswith("skip") for label in labels):
+            self._next_profile()
+        elif any(label == "cancel" for label in labels):
+            self.composing = self.keyboard = False
+        elif any("send" in label and "like" in label for label in labels):
+            self.sent.append(self.typed)
+            logging.info(f"[replay] Sent: {self.typed}")
+            self._next_profile()
+        elif any(label == "like" for label in labels) and self.compose is not None:
+            self.composing = True
+
+    def _input(self, args):
+        if args[:1] == ["tap"] and len(args) >= 3:
+            self._tap(int(float(args[1])), int(float(args[2])))
+        elif args[:1] == ["swipe"] and len(args) >= 5 and not self.composing:
+            y1, y2 = int(args[2]), int(args[4])
+            pages = len(self.profiles[self.profile])
+            # Finger moving up scrolls further down the profile
+            self.page = min(self.page + 1, pages - 1) if y2 < y1 else max(self.page - 1, 0)
+        elif args[:1] == ["text"] and len(args) >= 2:
+            self.typed += " ".join(args[1:]).replace("%s", " ")
+        elif args[:2] == ["keyevent", "4"]:
+            # Back hides the keyboard first
+            self.keyboard = False
+        elif args[:1] in (["keyevent"], ["keycombination"]):
+            self.typed = ""
+
+    def _broadcast(self, args):
+        if "ADB_INPUT_B64" in args and "msg" in args:
+            self.typed += base64.b64decode(args[args.index("msg") + 1]).decode("utf-8")
+        elif "ADB_CLEAR_TEXT" in args:
+            self.typed = ""
+
+    def run(self, cmd, timeout=None):
+        """Executes `cmd` against the replayed screen and returns (exit_code, output)."""
+        # Compound commands (a || b) run their first part only; that's where the effect is
+        first = cmd.split("||")[0].split("&&")[0]
+        args = shlex.split(first)
+        program = args[0] if args else ""
+        with span(f"adb.shell.{program}") as record:
+            code, output = self._run(program, args)
+            record["bytes"] = len(output)
+            return code, output
+
+    def _run(self, program, args):
+        if program in SCREEN_CHANGING_COMMANDS:
+            self.generation += 1
+        if program == "input":
+            extra = int(args[5]) / 1000 if args[1:2] == ["swipe"] and len(args) > 5 else 0.0
+            self._sleep("input", extra)
+            self._input(args[1:])
+            return 0, ""
+        if program == "am":
+            self._sleep("shell")
+            self._broadcast(args)
+            return 0, "Broadcast completed: result=0\n"
+        if program == "screencap":
+            self._sleep("screencap")
+            return 0, hashlib.md5(self.current_xml()).hexdigest() + "  -\n"
+        self._sleep("shell")
+        if program == "dumpsys" and "input_method" in args:
+            return 0, f"  mInputShown={'true' if self.keyboard else 'false'}\n"
+        if program == "settings":
+            return 0, "com.google.android.inputmethod.latin/com.android.inputmethod.latin.LatinIME\n"
+        return 0, ""
+
+    def shell(self, cmd, check=False, timeout=None):
+        return self.run(cmd, timeout)[1].strip()
+
+    def exec_out(self, *args, timeout=None):
+        if args[:2] == ("uiautomator", "dump"):
+            return self.dump_ui()
+        with span(f"adb.exec_out.{args[0]}"):
+            if args[:1] == ("screencap",):
+                self._sleep("screencap")
+                return BLANK_PNG
+            self._sleep("shell")
+            return b""
+
+    def dump_ui(self, timeout=None):
+        with span("adb.dump_ui") as record:
+            self._sleep("dump")
+            record["bytes"] = len(self.current_xml())
+            return self.current_xml()
+
+    def pull(self, remote_path, local_path, timeout=None):
+        self._sleep("shell")
+        with open(local_path, "wb") as f:
+            f.write(self.current_xml())
+
+    def adb_command(self, *args):
+        return ["true"]
+
+    def close(self):
+        pass
+
+
+def prompts_from_responses(folder):
+    """Known prompts harvested from the saved prompt/response examples ("Prompt: answer" lines)."""
+    prompts = set()
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), encoding="utf-8") as f:
+            section = None
+            for line in f:
+                line = line.strip()
+                if line in ("Prompt:", "Response:"):
+                    section = line
+                elif section == "Prompt:" and ": " in line:
+                    prompts.add(line.split(": ", 1)[0])
+    return prompts
+
+
+def bench(cycles, sources, latency_scale, prompts_file, seed=0):
+    """Runs `cycles` full bot cycles against a ReplayDevice and a stub LLM in a scratch directory."""
+    repo = os.getcwd()
+    sources = [s if s == "archive" or os.path.isabs(s) else os.path.join(repo, s) for s in sources]
+    profiles = load_profiles(sources)
+    compose = load_compose(os.path.join(repo, COMPOSE_DUMP))
+    workdir = tempfile.mkdtemp(prefix="hinge-genie-bench-")
+    os.makedirs(os.path.join(workdir, "history"))
+    if prompts_file and os.path.exists(prompts_file):
+        shutil.copy(prompts_file, os.path.join(workdir, "history", "allPromts.txt"))
+    else:
+        with open(os.path.join(workdir, "history", "allPromts.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(sorted(prompts_from_responses(os.path.join(repo, "respones")))))
+    os.chdir(workdir)
+    try:
+        from utils.device import set_device
+        from utils.llm import llm, StubBackend
+        from utils.llm_cache import get_cached_llm
+        import main
+
+        random.seed(seed)
+        device = ReplayDevice(profiles, compose=compose, latency_scale=latency_scale)
+        set_device(device)
+        llm.set_backend(StubBackend())
+        get_cached_llm().cache = None
+        timings = []
+        for _ in range(cycles):
+            start = time.perf_counter()
+            asyncio.run(main.run_bot())
+            timings.append(time.perf_counter() - start)
+        spans = get_metrics().summary()[0]
+    finally:
+        # Drain queued history writes and close everything while still in the scratch
+        # directory, which holds the history and metrics files
+        from utils.interaction_manager import close_history
+        from utils.history_store import get_history_store
+        close_history()
+        get_history_store().close()
+        get_metrics().close()
+        os.chdir(repo)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if not device.sent:
+        raise RuntimeError(f"No replayed cycle reached Send ({cycles} cycles); the timings would only cover the failure path")
+    timings.sort()
+    return {
+        "cycles": cycles,
+        "latency_scale": latency_scale,
+        "mean_s": statistics.mean(timings),
+        "p50_s": timings[len(timings) // 2],
+        "max_s": timings[-1],
+        "commands": device.counts,
+        "sent": len(device.sent),
+        "spans": spans,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='[%(asctime)s] %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=3, help="Number of bot cycles to time")
+    parser.add_argument("--source", action="append", help="Recorded profile (dir, file or 'archive'); repeatable")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for simulated command latency")
+    parser.add_argument("--prompts", default=os.path.join("history", "allPromts.txt"),
+                        help="Known prompts file (default: harvested from respones/ if missing)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    result = bench(args.cycles, args.source or list(DEFAULT_SOURCES), args.latency_scale, args.prompts)
+    print(f"{result['cycles']} cycles: mean {result['mean_s']:.3f} s, p50 {result['p50_s']:.3f} s, "
+          f"max {result['max_s']:.3f} s; commands {result['commands']}; sent {result['sent']}")
+    print(f"{'span':28} {'count':>6} {'p50 s':>8} {'p95 s':>8} {'total s':>9}")
+    for name, s in sorted(result["spans"].items(), key=lambda item: -item[1]["total"]):
+        print(f"{name:28} {s['count']:>6} {s['p50']:>8.3f} {s['p95']:>8.3f} {s['total']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0)
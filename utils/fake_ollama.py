@@ -0,0 +1,105 @@
+"""
+Tiny stand-in for Ollama's `/api/generate`, for exercising the generation path offline.
+
+    python -m utils.fake_ollama --port 11434 --latency 0.2 --fail-rate 0.1
+    python -m utils.fake_ollama --bench 200
+
+Point `ollama_api_url` at it and set `gpt.backend: ollama` to run the bot without a model;
+`--bench` starts the server in-process and times N calls through OllamaBackend.
+"""
+import json
+import time
+import random
+import logging
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_REPLY = "That sounds like a fun way to spend a weekend! What got you into it?"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._reply(404, {"error": "not found"})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.fail_rate:
+            self._reply(503, {"error": "simulated overload"})
+            return
+        prompt = body.get("prompt", "")
+        self._reply(200, {
+            "model": body.get("model", "fake"),
+            "response": self.server.reply,
+            "done": True,
+            "prompt_eval_count": len(prompt.split()),
+            "eval_count": len(self.server.reply.split()),
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def start_server(host="127.0.0.1", port=11434, latency=0.0, fail_rate=0.0, reply=CANNED_REPLY):
+    """Starts the fake server on a daemon thread and returns it (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.reply = reply
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+def bench(calls, latency, fail_rate):
+    """Times `calls` generations through OllamaBackend against an in-process fake server."""
+    from utils.llm import OllamaBackend
+
+    server = start_server(port=0, latency=latency, fail_rate=fail_rate)
+    host, port = server.server_address
+    backend = OllamaBackend(url=f"http://{host}:{port}/api/generate", model="fake")
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        backend.call("Profile Prompts:\nMy happy place: the beach")
+        timings.append(time.perf_counter() - start)
+    server.shutdown()
+    timings.sort()
+    print(f"{calls} calls: mean {statistics.mean(timings) * 1000:.2f} ms, "
+          f"p50 {timings[len(timings) // 2] * 1000:.2f} ms, p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each reply")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    parser.add_argument("--bench", type=int, metavar="N", help="Run N calls against an in-process server and exit")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench, args.latency, args.fail_rate)
+    else:
+        server = start_server(args.host, args.port, args.latency, args.fail_rate)
+        logging.info(f"Fake Ollama listening on http://{args.host}:{args.port}/api/generate")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,129 @@
+"""
+Raw screen captures held in memory.
+
+`screencap` without -p sends the framebuffer as is: a small header (width, height, pixel
+format, and from Android 10 a colour space) followed by 4 bytes per pixel. That skips the
+PNG encode on the device, which costs far more than the larger transfer, and nothing is
+written to disk on either side. With NumPy installed, array() is a zero-copy view of the
+received bytes; without it, the few hundred pixels dhash() needs are read straight from them.
+NumPy is only imported on the first capture, so importing this module stays cheap.
+"""
+import struct
+from utils.device import get_device
+from utils.metrics import span
+
+_numpy = None
+_numpy_checked = False
+
+# android.graphics.PixelFormat values screencap emits, and where R, G, B sit in each pixel
+CHANNELS = {1: (0, 1, 2), 2: (0, 1, 2), 5: (2, 1, 0)}  # RGBA_8888, RGBX_8888, BGRA_8888
+BYTES_PER_PIXEL = 4
+HEADER_SIZES = (12, 16)
+# dHash grid: each of the 8 rows compares 9 neighbouring cells, giving 64 bits
+HASH_COLS = 9
+HASH_ROWS = 8
+# Pixels averaged per cell along each axis
+SAMPLES = 4
+# Regions whose sampled brightness varies less than this are blank or still loading
+MIN_CONTRAST = 8
+
+
+def get_numpy():
+    """Returns the numpy module, imported on first use, or None when it is not installed."""
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:  # optional; pixels are read from the bytes instead
+            _numpy = None
+        _numpy_checked = True
+    return _numpy
+
+
+class Framebuffer:
+    """One raw screen capture: dimensions, pixel format and the bytes as received."""
+
+    def __init__(self, width, height, pixel_format, data, offset=0):
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.data = data
+        self.offset = offset
+
+    @classmethod
+    def parse(cls, raw):
+        """Reads the screencap header; raises ValueError for data that is not a raw capture."""
+        if len(raw) < HEADER_SIZES[0]:
+            raise ValueError("Raw screencap too short")
+        width, height, pixel_format = struct.unpack_from("<III", raw)
+        if pixel_format not in CHANNELS:
+            raise ValueError(f"Unsupported screencap pixel format {pixel_format}")
+        header = len(raw) - width * height * BYTES_PER_PIXEL
+        if header not in HEADER_SIZES:
+            raise ValueError(f"Raw screencap size does not match {width}x{height}")
+        return cls(width, height, pixel_format, raw, header)
+
+    def array(self):
+        """The pixels as a (height, width, 4) uint8 NumPy view of the received bytes. Needs NumPy."""
+        np = get_numpy()
+        if np is None:
+            raise RuntimeError("NumPy is not installed")
+        return np.frombuffer(self.data, dtype=np.uint8, count=self.width * self.height * BYTES_PER_PIXEL,
+                             offset=self.offset).reshape(self.height, self.width, BYTES_PER_PIXEL)
+
+    def box(self, region):
+        """Pixel box (left, top, right, bottom) for a region given as fractions of the screen."""
+        left, top, right, bottom = region
+        return (int(left * self.width), int(top * self.height),
+                max(int(right * self.width), int(left * self.width) + 1),
+                max(int(bottom * self.height), int(top * self.height) + 1))
+
+    def luma_grid(self, box, cols, rows, samples=SAMPLES):
+        """
+        Summed brightness (ITU-R 601 weights, integer maths) of `cols` x `rows` cells covering
+        `box`, each sampled on a `samples` x `samples` grid. Returned as a list of rows.
+        """
+        left, top, right, bottom = box
+        xs = [left + (2 * i + 1) * (right - left) // (2 * cols * samples) for i in range(cols * samples)]
+        ys = [top + (2 * i + 1) * (bottom - top) // (2 * rows * samples) for i in range(rows * samples)]
+        r, g, b = CHANNELS[self.pixel_format]
+        np = get_numpy()
+        if np is not None:
+            pixels = self.array()[ys][:, xs].astype(np.int32)
+            luma = (299 * pixels[..., r] + 587 * pixels[..., g] + 114 * pixels[..., b]) // 1000
+            return luma.reshape(rows, samples, cols, samples).sum(axis=(1, 3)).tolist()
+        data, offset, stride = self.data, self.offset, self.width * BYTES_PER_PIXEL
+        grid = [[0] * cols for _ in range(rows)]
+        for row_index, y in enumerate(ys):
+            cells = grid[row_index // samples]
+            base = offset + y * stride
+            for col_index, x in enumerate(xs):
+                p = base + x * BYTES_PER_PIXEL
+                cells[col_index // samples] += (299 * data[p + r] + 587 * data[p + g] + 114 * data[p + b]) // 1000
+        return grid
+
+    def dhash(self, region=(0.0, 0.0, 1.0, 1.0)):
+        """
+        64-bit difference hash of `region` (fractions of the screen): one bit per pair of
+        horizontally neighbouring cells, set when the left one is darker. Returns None when the
+        region is close to uniform, since every blank screen would hash the same.
+        """
+        grid = self.luma_grid(self.box(region), HASH_COLS, HASH_ROWS)
+        cells = [value for row in grid for value in row]
+        if (max(cells) - min(cells)) < MIN_CONTRAST * SAMPLES * SAMPLES:
+            return None
+        value = 0
+        for row in grid:
+            for left, right in zip(row, row[1:]):
+                value = (value << 1) | (left < right)
+        return value
+
+
+def capture_framebuffer(device=None):
+    """Captures the screen as a raw Framebuffer. Raises ValueError if the device sent something else."""
+    device = device or get_device()
+    with span("capture.framebuffer") as record:
+        raw = device.exec_out("screencap")
+        record["bytes"] = len(raw)
+        return Framebuffer.parse(raw)
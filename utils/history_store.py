@@ -0,0 +1,267 @@
+"""
+Single-file sqlite history of interactions, prompt/response pairs, sent messages and
+seen profile photo hashes.
+
+    python -m utils.history_store stats
+    python -m utils.history_store show prompt_responses --limit 20 --search "happy place"
+    python -m utils.history_store export prompt_responses --format csv --out responses.csv
+"""
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+HISTORY_DB = os.path.join("history", "history.sqlite3")
+LEGACY_INTERACTION_LOG = os.path.join("history", "interactions.log")
+BATCH_SIZE = 20
+FLUSH_INTERVAL = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    profile TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompt_responses (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT,
+    sent INTEGER
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    message TEXT NOT NULL,
+    profile_image TEXT
+);
+CREATE TABLE IF NOT EXISTS profile_hashes (
+    hash INTEGER PRIMARY KEY,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS prompt_responses_created ON prompt_responses (created);
+CREATE INDEX IF NOT EXISTS messages_created ON messages (created);
+"""
+TABLES = ("interactions", "prompt_responses", "messages", "profile_hashes")
+
+
+class HistoryStore:
+    """
+    Embedded sqlite (WAL) store for everything the bot remembers between runs.
+
+    `has_interacted` is answered from an in-memory set loaded at open, so it never touches
+    disk. Writes are grouped into transactions that commit every `batch_size` writes or
+    `flush_interval` seconds, whichever comes first, and on flush()/close(). The interval is
+    checked on each write and by flush_if_due(), which the history writer calls when idle, so
+    a lone write is not left uncommitted until the next one.
+    """
+
+    def __init__(self, db_path=HISTORY_DB, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._migrate()
+        self._interacted = {row[0] for row in self._db.execute("SELECT profile FROM interactions")}
+        if not self._interacted:
+            self._import_legacy_log()
+
+    def _migrate(self):
+        """Adds columns introduced after a database was created."""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(prompt_responses)")}
+        if "sent" not in columns:
+            # Rows from before the column have NULL: whether they were sent is unknown
+            self._db.execute("ALTER TABLE prompt_responses ADD COLUMN sent INTEGER")
+            self._db.commit()
+
+    def _import_legacy_log(self):
+        """One-time import of the old plain-text interactions.log."""
+        if not os.path.exists(LEGACY_INTERACTION_LOG):
+            return
+        with open(LEGACY_INTERACTION_LOG, "r") as f:
+            names = [line.strip() for line in f if line.strip()]
+        now = time.time()
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO interactions (profile, name, created) VALUES (?, ?, ?)",
+                                 [(name.lower(), name, now) for name in names])
+            self._db.commit()
+            self._interacted.update(name.lower() for name in names)
+        logging.info(f"Imported {len(names)} interactions from {LEGACY_INTERACTION_LOG}")
+
+    def _write(self, sql, params):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._pending += 1
+            if self._pending >= self.batch_size or time.monotonic() - self._last_commit >= self.flush_interval:
+                self.flush()
+            return cursor.lastrowid
+
+    def flush(self):
+        """Commits any pending writes."""
+        with self._lock:
+            if self._pending:
+                self._db.commit()
+                self._pending = 0
+            self._last_commit = time.monotonic()
+
+    def flush_if_due(self):
+        """Commits pending writes once `flush_interval` seconds have passed since the last commit."""
+        with self._lock:
+            if self._pending and time.monotonic() - self._last_commit >= self.flush_interval:
+                self.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._db.close()
+
+    def has_interacted(self, profile_name):
+        return profile_name.lower() in self._interacted
+
+    def mark_interacted(self, profile_name):
+        """Adds the profile to the in-memory set only; returns False if it was already there."""
+        key = profile_name.lower()
+        if key in self._interacted:
+            return False
+        self._interacted.add(key)
+        return True
+
+    def record_interaction(self, profile_name):
+        """Writes the interaction row (see mark_interacted for the in-memory side)."""
+        self._write("INSERT OR IGNORE INTO interactions (profile, name, created) VALUES (?, ?, ?)",
+                    (profile_name.lower(), profile_name, time.time()))
+
+    def log_interaction(self, profile_name):
+        if self.mark_interacted(profile_name):
+            self.record_interaction(profile_name)
+
+    def add_prompt_response(self, prompt, response, sent=None):
+        return self._write("INSERT INTO prompt_responses (created, prompt, response, sent) VALUES (?, ?, ?, ?)",
+                           (time.time(), prompt, response, None if sent is None else int(bool(sent))))
+
+    def add_message(self, message, profile_image=None):
+        return self._write("INSERT INTO messages (created, message, profile_image) VALUES (?, ?, ?)",
+                           (time.time(), message, profile_image))
+
+    def recent_replies(self, limit):
+        """Most recent replies that were sent (or predate the sent flag) and sent messages, newest first."""
+        with self._lock:
+            self.flush()
+            cursor = self._db.execute(
+                "SELECT response, created FROM prompt_responses WHERE response IS NOT NULL AND IFNULL(sent, 1) "
+                "UNION ALL SELECT message, created FROM messages ORDER BY created DESC LIMIT ?", (limit,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_profile_hash(self, value):
+        """Stores a 64-bit profile photo hash (see utils/seen_profiles.py)."""
+        # sqlite integers are signed
+        signed = value - (1 << 64) if value >= 1 << 63 else value
+        self._write("INSERT OR IGNORE INTO profile_hashes (hash, created) VALUES (?, ?)", (signed, time.time()))
+
+    def profile_hashes(self):
+        with self._lock:
+            self.flush()
+            return [value & ((1 << 64) - 1) for (value,) in self._db.execute("SELECT hash FROM profile_hashes")]
+
+    def rows(self, table, limit=None, search=None):
+        """Returns rows of `table` as dicts, newest first, optionally filtered by a text search."""
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}' (expected one of {', '.join(TABLES)})")
+        text_column = {"interactions": "name", "prompt_responses": "prompt || ' ' || IFNULL(response, '')",
+                       "messages": "message", "profile_hashes": "hash"}[table]
+        sql = f"SELECT * FROM {table}"
+        params = []
+        if search:
+            sql += f" WHERE {text_column} LIKE ?"
+            params.append(f"%{search}%")
+        sql += " ORDER BY created DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            self.flush()
+            cursor = self._db.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def stats(self):
+        with self._lock:
+            self.flush()
+            return {table: self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Returns the process-wide history store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+            atexit.register(_store.close)
+        return _store
+
+
+def _format_row(row):
+    row = dict(row)
+    row["created"] = datetime.fromtimestamp(row["created"]).isoformat(timespec="seconds")
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=HISTORY_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Row counts per table")
+    show = commands.add_parser("show", help="Print rows, newest first")
+    export = commands.add_parser("export", help="Write rows as JSON lines or CSV")
+    for sub in (show, export):
+        sub.add_argument("table", choices=TABLES)
+        sub.add_argument("--limit", type=int)
+        sub.add_argument("--search", help="Only rows whose text contains this")
+    export.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    export.add_argument("--out", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    if args.command == "stats":
+        for table, count in store.stats().items():
+            print(f"{table:18} {count}")
+    elif args.command == "show":
+        for row in store.rows(args.table, args.limit, args.search):
+            print(json.dumps(_format_row(row), ensure_ascii=False))
+    else:
+        rows = [_format_row(row) for row in store.rows(args.table, args.limit, args.search)]
+        out = open(args.out, "w", encoding="utf-8", newline="") if args.out else sys.stdout
+        try:
+            if args.format == "jsonl":
+                for row in rows:
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            elif rows:
+                writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        finally:
+            if args.out:
+                out.close()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
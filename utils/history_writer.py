@@ -0,0 +1,147 @@
+import queue
+import atexit
+import logging
+import threading
+from utils.config import get_setting
+
+DEFAULT_QUEUE_SIZE = 256
+# How long an important record may wait for queue space before it is written inline instead
+DEFAULT_PUT_TIMEOUT = 5.0
+DEFAULT_FLUSH_TIMEOUT = 10.0
+# Seconds without queued work after which the idle tasks run
+DEFAULT_IDLE_INTERVAL = 1.0
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Bounded queue plus a single writer thread that performs all history persistence.
+
+    Callers hand over a function and its arguments and return immediately. When the queue is
+    full, droppable work (UI dump copies) is discarded and counted, while important records
+    (interactions, prompts/responses, messages) wait up to `put_timeout` seconds for space
+    before being written on the caller's thread instead, so they are never lost.
+    Idle tasks (see add_idle_task) run on the writer thread whenever the queue has been empty
+    for `idle_interval` seconds.
+    """
+
+    def __init__(self, max_size=DEFAULT_QUEUE_SIZE, put_timeout=DEFAULT_PUT_TIMEOUT,
+                 idle_interval=DEFAULT_IDLE_INTERVAL):
+        self.put_timeout = put_timeout
+        self.idle_interval = idle_interval
+        self.stats = {"written": 0, "dropped": 0, "failed": 0, "inline": 0}
+        self._queue = queue.Queue(maxsize=max_size)
+        self._idle_tasks = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                task = self._queue.get(timeout=self.idle_interval)
+            except queue.Empty:
+                for func in list(self._idle_tasks):
+                    try:
+                        func()
+                    except Exception as e:
+                        logging.error(f"History idle task {getattr(func, '__name__', func)} failed: {e}")
+                continue
+            try:
+                if task is _STOP:
+                    return
+                if isinstance(task, threading.Event):
+                    task.set()  # flush() marker
+                else:
+                    self._execute(*task)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, func, args, kwargs):
+        try:
+            func(*args, **kwargs)
+            self.stats["written"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logging.error(f"History write {getattr(func, '__name__', func)} failed: {e}")
+
+    def add_idle_task(self, func):
+        """Runs func() on the writer thread each time the queue has been idle for `idle_interval` seconds."""
+        if func not in self._idle_tasks:
+            self._idle_tasks.append(func)
+
+    def submit(self, func, *args, droppable=False, **kwargs):
+        """
+        Queues func(*args, **kwargs) for the writer thread. Returns False if the work was
+        dropped because the queue was full (droppable work only).
+        """
+        task = (func, args, kwargs)
+        if self._closed:
+            self._execute(*task)
+            return True
+        if droppable:
+            try:
+                self._queue.put_nowait(task)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                logging.warning(f"History queue full, dropped {getattr(func, '__name__', func)} "
+                                f"({self.stats['dropped']} dropped so far)")
+                return False
+            return True
+        try:
+            self._queue.put(task, timeout=self.put_timeout)
+        except queue.Full:
+            logging.warning("History queue still full, writing record on the caller's thread")
+            self.stats["inline"] += 1
+            self._execute(*task)
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        """Waits until everything queued so far has been written. Returns False on timeout."""
+        done = threading.Event()
+        # A marker behind everything already queued; it is reached once they have been written
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        """Writes out the queue and stops the writer thread. Later submits run inline."""
+        if self._closed:
+            return
+        self._closed = True
+        remaining = self.pending()
+        if remaining:
+            logging.info(f"Flushing {remaining} pending history writes...")
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.error("History writer did not drain in time; pending writes may be lost")
+            return
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.error("History writer did not finish in time; pending writes may be lost")
+        else:
+            logging.info(f"History writer stopped ({self.stats})")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer():
+    """Returns the process-wide history writer, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter(
+                max_size=get_setting("history.queue_size", DEFAULT_QUEUE_SIZE),
+                put_timeout=get_setting("history.put_timeout", DEFAULT_PUT_TIMEOUT),
+            )
+            atexit.register(_writer.close)
+        return _writer
@@ -1,92 +1,89 @@
 import os
 import logging
-import shutil
-from datetime import datetime
+from utils.config import get_setting
+from utils.history_store import get_history_store
+from utils.history_writer import get_history_writer
+from utils.dump_archive import get_dump_archive
 
 # --- Directory and File Configuration ---
 HISTORY_DIR = "history"
-DUMPS_DIR = os.path.join(HISTORY_DIR, "dumps")
-MATCHES_DIR = os.path.join(HISTORY_DIR, "new_matches")
-PROFILES_DIR = os.path.join(HISTORY_DIR, "profiles")
-MESSAGES_DIR = os.path.join(HISTORY_DIR, "messages")
-INTERACTION_LOG_FILE = os.path.join(HISTORY_DIR, "interactions.log")
+
+# All history persistence below runs on the history writer thread; the public save_*
+# functions only queue the work, so the capture/tap loop never waits on disk.
+
+def _writer():
+    # Open the store first so its atexit close is registered before (and so runs after)
+    # the writer's, which drains the queue into it
+    store = get_history_store()
+    writer = get_history_writer()
+    # Commit a lone write once the flush interval has passed, not only on the next write
+    writer.add_idle_task(store.flush_if_due)
+    return writer
 
 def setup_history_folders():
-    """Creates the necessary history directories if they don't exist."""
-    os.makedirs(DUMPS_DIR, exist_ok=True)
-    os.makedirs(MATCHES_DIR, exist_ok=True)
-    os.makedirs(PROFILES_DIR, exist_ok=True)
-    os.makedirs(MESSAGES_DIR, exist_ok=True)
+    """Creates the necessary history directories if they don't exist and starts the history writer."""
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    _writer()
     logging.info("History folders are set up.")
 
+def close_history():
+    """Writes out everything still queued for history. Call on shutdown (also runs at exit)."""
+    _writer().close()
+
 def log_interaction(profile_name):
     """Logs that an interaction with a profile was completed."""
-    with open(INTERACTION_LOG_FILE, "a") as f:
-        f.write(f"{profile_name}\n")
-    logging.info(f"Logged successful interaction with '{profile_name}'.")
+    store = get_history_store()
+    # The in-memory set is updated right away so has_interacted() sees it before the row is written
+    if store.mark_interacted(profile_name):
+        _writer().submit(store.record_interaction, profile_name)
+        logging.info(f"Logged successful interaction with '{profile_name}'.")
 
 def has_interacted(profile_name):
-    """Checks if we have already interacted with this profile."""
-    if not os.path.exists(INTERACTION_LOG_FILE):
-        return False
-    with open(INTERACTION_LOG_FILE, "r") as f:
-        interacted_profiles = {line.strip().lower() for line in f}
-    return profile_name.lower() in interacted_profiles
-
-def save_dump_to_history(dump_file_path):
-    """Saves a copy of the UI dump to the history/dumps folder with a timestamp."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    history_dump_path = os.path.join(DUMPS_DIR, f"dump_{timestamp}.xml")
-    try:
-        shutil.copy(dump_file_path, history_dump_path)
-        logging.info(f"Saved UI dump to {history_dump_path}")
-        return history_dump_path
-    except IOError as e:
-        logging.error(f"Failed to copy dump to history: {e}")
-        return None
-
-def save_new_match_dump(profile_name, dump_file_path):
-    """Saves the UI dump for a new match to a special folder for review and returns the file path."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    match_dump_path = os.path.join(MATCHES_DIR, f"{profile_name}_{timestamp}.xml")
-    try:
-        shutil.copy(dump_file_path, match_dump_path)
-        logging.info(f"Saved new match UI dump to {match_dump_path}")
-        return match_dump_path
-    except IOError as e:
-        logging.error(f"Failed to save new match dump: {e}")
-        return None
-
-def save_profile_and_message(profile_image_path, message):
-    """Saves the profile image and sent message to history with timestamp."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # Save profile image
-    profile_history_path = os.path.join(PROFILES_DIR, f"profile_{timestamp}.png")
-    try:
-        shutil.copy(profile_image_path, profile_history_path)
-        logging.info(f"Saved profile image to {profile_history_path}")
-    except IOError as e:
-        logging.error(f"Failed to save profile image: {e}")
-    
-    # Save message
-    message_history_path = os.path.join(MESSAGES_DIR, f"message_{timestamp}.txt")
-    try:
-        with open(message_history_path, "w", encoding="utf-8") as f:
-            f.write(message)
-        logging.info(f"Saved message to {message_history_path}")
-    except IOError as e:
-        logging.error(f"Failed to save message: {e}")
-
-def save_prompt_and_response(prompt, response):
-    """Saves the prompt and the generated response to history/prompt-response with timestamp."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    directory = "history/prompt-response"
-    os.makedirs(directory, exist_ok=True)
-    file_path = os.path.join(directory, f"prompt_response_{timestamp}.txt")
-    try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(f"Prompt:\n{prompt}\n\nResponse:\n{response}\n")
-        logging.info(f"Saved prompt and response to {file_path}")
-    except IOError as e:
-        logging.error(f"Failed to save prompt and response: {e}")
\ No newline at end of file
+    """Checks if we have already interacted with this profile (in-memory lookup)."""
+    return get_history_store().has_interacted(profile_name)
+
+def dump_archiving_enabled():
+    """Returns whether UI dumps should be written to disk under history/."""
+    return bool(get_setting("history.archive_dumps", True))
+
+def _archive_dump(dump, kind, label=None):
+    path = get_dump_archive().put(dump, kind=kind, label=label)
+    logging.debug(f"Saved UI dump to {path}")
+
+def save_dump_to_history(dump):
+    """Queues the UI dump (XML bytes or file path) for the deduplicating dump archive. Dropped if the queue is full."""
+    return _writer().submit(_archive_dump, dump, "dump", droppable=True)
+
+def save_new_match_dump(profile_name, dump):
+    """Queues the UI dump (XML bytes or file path) for a new match, labelled with the profile name."""
+    return _writer().submit(_archive_dump, dump, "new_match", profile_name)
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    logging.debug(f"Saved UI dump: {path}")
+
+def _clear_dump_files(folder):
+    for name in os.listdir(folder):
+        if name.startswith("dump_") and name.endswith(".xml"):
+            os.remove(os.path.join(folder, name))
+
+def clear_dump_files(folder):
+    """Queues removing the dump_*.xml files in `folder`, ahead of any dump saved after this call."""
+    return _writer().submit(_clear_dump_files, folder)
+
+def save_dump_file(path, dump):
+    """Queues writing the XML bytes of a dump to `path`. Dropped if the queue is full."""
+    return _writer().submit(_write_file, path, dump, droppable=True)
+
+def save_profile_hash(value):
+    """Queues storing a profile photo hash in the history store."""
+    _writer().submit(get_history_store().add_profile_hash, value)
+
+def _store_prompt_and_response(prompt, response, sent):
+    row_id = get_history_store().add_prompt_response(prompt, response, sent)
+    logging.info(f"Saved prompt and response #{row_id} to history store")
+
+def save_prompt_and_response(prompt, response, sent=None):
+    """Queues recording the prompt, the generated response and whether it was sent in the history store."""
+    _writer().submit(_store_prompt_and_response, prompt, response, sent)
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import logging
+import threading
+from utils.config import get_setting
+from utils.device import get_device
+from utils.history_writer import get_history_writer
+
+LAYOUT_CACHE_FILE = os.path.join("history", "layout_cache.json")
+APP_PACKAGE = "co.hinge.app"
+# Controls that sit at fixed positions, per screen type, and the UiSnapshot query finding each.
+# Send moves up once the keyboard is shown, so it is only taken from a compose dump made after typing.
+CONTROLS = {
+    "profile": {"skip": "skip_button"},
+    "compose": {"input_field": "input_field", "cancel": "cancel"},
+    "compose_typed": {"send": "send_button"},
+}
+SIZE_RE = re.compile(r"(\d+)x(\d+)")
+VERSION_RE = re.compile(r"versionName=(\S+)")
+
+
+def center(bounds):
+    left, top, right, bottom = bounds
+    return (left + right) // 2, (top + bottom) // 2
+
+
+class LayoutCache:
+    """
+    Remembers where fixed controls (Skip, the compose field, Send, Cancel) were found, per
+    device serial, resolution, app version and screen type, so later cycles can tap them
+    without dumping the screen first.
+
+    Entries are trusted when served and checked afterwards: callers evict() one whose tap had
+    no effect, and remember() compares every snapshot it is given with what is cached,
+    replacing entries the screen no longer agrees with. The cache is kept in a small JSON
+    file written by the history writer.
+    """
+
+    def __init__(self, path=LAYOUT_CACHE_FILE, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._entries = {}
+        self._device_keys = {}
+        self._lock = threading.Lock()
+        if enabled and path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable layout cache {path}: {e}")
+
+    def _device_key(self, device):
+        key = self._device_keys.get(id(device))
+        if key is None:
+            # Override size wins over the physical one when both are reported
+            sizes = SIZE_RE.findall(device.shell("wm size"))
+            resolution = "x".join(sizes[-1]) if sizes else "unknown"
+            version = VERSION_RE.search(device.shell(f"dumpsys package {APP_PACKAGE} | grep versionName"))
+            key = self._device_keys[id(device)] = \
+                f"{getattr(device, 'serial', None) or 'default'}|{resolution}|{version.group(1) if version else 'unknown'}"
+        return key
+
+    def key(self, screen, device=None):
+        return f"{self._device_key(device or get_device())}|{screen}"
+
+    def get(self, screen, control, device=None):
+        """Cached (left, top, right, bottom) of `control` on `screen`, or None."""
+        if not self.enabled:
+            return None
+        key = self.key(screen, device)
+        with self._lock:
+            bounds = self._entries.get(key, {}).get(control)
+        return tuple(bounds) if bounds else None
+
+    def center(self, screen, control, device=None):
+        """Cached tap point of `control` on `screen`, or None."""
+        bounds = self.get(screen, control, device)
+        return center(bounds) if bounds else None
+
+    def evict(self, screen, control, device=None):
+        if not self.enabled:
+            return
+        key = self.key(screen, device)
+        with self._lock:
+            removed = self._entries.get(key, {}).pop(control, None)
+        if removed is not None:
+            logging.info(f"Dropped cached position of '{control}' on the {screen} screen")
+            self._save()
+
+    def remember(self, screen, snapshot, device=None):
+        """
+        Records where the controls of `screen` are in `snapshot`, a dump of that screen.
+        Cached positions the snapshot disagrees with are replaced; controls it doesn't
+        contain are left alone.
+        """
+        if not self.enabled:
+            return
+        key = self.key(screen, device)
+        changed = False
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            for control, query in CONTROLS[screen].items():
+                # Nodes whose bounds don't parse (bounds() gives None) can't be tapped from the cache
+                located = [b for b in (snapshot.bounds(node) for node in snapshot.query(query)) if b is not None]
+                if not located:
+                    continue
+                bounds = list(located[0])
+                if entry.get(control) != bounds:
+                    if control in entry:
+                        logging.info(f"'{control}' moved on the {screen} screen; updating its cached position")
+                    entry[control] = bounds
+                    changed = True
+        if changed:
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._entries, indent=1)
+        get_history_writer().submit(self._write, data)
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Write-then-rename so a crash never leaves half a file
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(self.path + ".tmp", self.path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_layout_cache():
+    """Returns the process-wide layout cache, loading it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LayoutCache(path=get_setting("layout_cache.path", LAYOUT_CACHE_FILE),
+                                 enabled=get_setting("layout_cache.enabled", True))
+        return _cache
@@ -1,30 +1,237 @@
 import os
+import time
+import random
 import logging
-from dotenv import load_dotenv
-from crewai import LLM
+import threading
+from utils.config import get_setting
+from utils.metrics import span, count
 
 
-# Load environment variables
-load_dotenv()
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini LLM with robust error handling
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables")
-
-    os.environ["GOOGLE_API_KEY"] = api_key
-
-    llm = LLM(
-        model='gemini/gemini-2.0-flash-lite',
-        api_key=api_key,
-        temperature=0.5,  # Lower temperature for higher consistency and professionalism.
-        max_tokens=160
-    )
-    logger.info("LLM initialized successfully with Gemini 2.0 Flash Lite")
-except Exception as e:
-    logger.error(f"Failed to initialize LLM: {str(e)}")
-    raise Exception(f"LLM initialization failed: {str(e)}")
+GEMINI_MODEL = 'gemini/gemini-2.0-flash-lite'
+OLLAMA_API_URL = "http://localhost:11434/api/generate"
+DEFAULT_TEMPERATURE = 0.5
+DEFAULT_MAX_TOKENS = 160
+DEFAULT_MAX_RETRIES = 3
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 60
+STUB_REPLY = "That sounds like a fun way to spend a weekend! What got you into it?"
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class GeminiBackend:
+    """Generates replies with Gemini through litellm."""
+
+    def __init__(self, model=GEMINI_MODEL, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS,
+                 max_retries=DEFAULT_MAX_RETRIES, timeout=READ_TIMEOUT):
+        from dotenv import load_dotenv
+        import litellm
+
+        # Load environment variables
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        os.environ["GOOGLE_API_KEY"] = api_key
+
+        self._litellm = litellm
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+    def call(self, prompt, max_tokens=None):
+        response = self._litellm.completion(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            api_key=self.api_key,
+            temperature=self.temperature,
+            max_tokens=max_tokens or self.max_tokens,
+            num_retries=self.max_retries,
+            timeout=self.timeout,
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            count("llm.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+            count("llm.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+        return response.choices[0].message.content
+
+
+class OllamaBackend:
+    """
+    Generates replies with a local Ollama-compatible `/api/generate` endpoint.
+
+    Requests go over one pooled keep-alive HTTP session, so after the first call there is no
+    connection setup left per reply. Connection errors, timeouts and 5xx responses are retried
+    up to `max_retries` times with jittered exponential backoff.
+    """
+
+    def __init__(self, url=OLLAMA_API_URL, model="llama3.1:8b-instruct-q2_k", temperature=DEFAULT_TEMPERATURE,
+                 max_tokens=DEFAULT_MAX_TOKENS, max_retries=DEFAULT_MAX_RETRIES,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._requests = requests
+        self.url = url
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def call(self, prompt, max_tokens=None):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"temperature": self.temperature, "num_predict": max_tokens or self.max_tokens},
+        }
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    data = response.json()
+                    count("llm.prompt_tokens", data.get("prompt_eval_count", 0))
+                    count("llm.completion_tokens", data.get("eval_count", 0))
+                    return data.get("response", "").strip()
+                error = f"HTTP {response.status_code}"
+            except (self._requests.ConnectionError, self._requests.Timeout) as e:
+                error = str(e)
+            if attempt == self.max_retries:
+                raise RuntimeError(f"Ollama request failed after {attempt + 1} attempts: {error}")
+            delay = backoff_delay(attempt)
+            logger.warning(f"Ollama request failed ({error}), retrying in {delay:.2f}s...")
+            count("llm.retries")
+            time.sleep(delay)
+
+
+class StubBackend:
+    """Returns a canned reply after `latency` seconds, for offline runs and benchmarks."""
+
+    def __init__(self, reply=STUB_REPLY, latency=0.0):
+        self.model = "stub"
+        self.temperature = 0
+        self.reply = reply
+        self.latency = latency
+
+    def call(self, prompt, max_tokens=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.reply
+
+
+def create_backend():
+    """Builds the generation backend selected by `gpt.backend` in config.yaml."""
+    backend = get_setting("gpt.backend", "gemini")
+    temperature = get_setting("gpt.temperature", DEFAULT_TEMPERATURE)
+    max_tokens = get_setting("gpt.max_tokens", DEFAULT_MAX_TOKENS)
+    max_retries = get_setting("max_retries", DEFAULT_MAX_RETRIES)
+    if backend == "gemini":
+        return GeminiBackend(
+            model=get_setting("gpt.gemini_model", GEMINI_MODEL),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_retries=max_retries,
+            timeout=get_setting("gpt.read_timeout", READ_TIMEOUT),
+        )
+    if backend == "ollama":
+        return OllamaBackend(
+            url=get_setting("ollama_api_url", OLLAMA_API_URL),
+            model=get_setting("gpt.model"),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_retries=max_retries,
+            connect_timeout=get_setting("gpt.connect_timeout", CONNECT_TIMEOUT),
+            read_timeout=get_setting("gpt.read_timeout", READ_TIMEOUT),
+        )
+    if backend == "stub":
+        return StubBackend(reply=get_setting("gpt.stub_reply", STUB_REPLY),
+                           latency=get_setting("gpt.stub_latency", 0.0))
+    raise ValueError(f"Unknown gpt.backend '{backend}' (expected 'gemini', 'ollama' or 'stub')")
+
+
+class LazyLLM:
+    """
+    Thin client for the configured LLM backend that builds it on first use.
+
+    Importing this module costs nothing: litellm/requests are only imported, and
+    API keys only checked, when a reply is actually generated (or when warm_up()
+    is called), so tools that just reuse the parsing/ADB helpers never pay for it.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._warm_up_thread = None
+
+    @property
+    def model(self):
+        if self._backend is not None:
+            return self._backend.model
+        if get_setting("gpt.backend", "gemini") == "gemini":
+            return get_setting("gpt.gemini_model", GEMINI_MODEL)
+        return get_setting("gpt.model")
+
+    @property
+    def temperature(self):
+        if self._backend is not None:
+            return self._backend.temperature
+        return get_setting("gpt.temperature", DEFAULT_TEMPERATURE)
+
+    def _resolve(self):
+        with self._lock:
+            if self._backend is not None:
+                return self._backend
+            try:
+                self._backend = create_backend()
+                logger.info(f"LLM initialized successfully with {type(self._backend).__name__} ({self._backend.model})")
+                return self._backend
+            except Exception as e:
+                logger.error(f"Failed to initialize LLM: {str(e)}")
+                raise Exception(f"LLM initialization failed: {str(e)}")
+
+    def set_backend(self, backend):
+        """Uses `backend` from now on instead of the configured one."""
+        with self._lock:
+            self._backend = backend
+
+    def warm_up(self):
+        """Starts building the backend on a background thread, if that hasn't happened yet."""
+        if self._backend is not None or self._warm_up_thread is not None:
+            return
+
+        def _warm_up():
+            try:
+                self._resolve()
+            except Exception:
+                pass  # Already logged; the next call() raises the same error
+
+        self._warm_up_thread = threading.Thread(target=_warm_up, name="llm-warm-up", daemon=True)
+        self._warm_up_thread.start()
+
+    def call(self, prompt, max_tokens=None):
+        """Generates a reply for `prompt`, allowing `max_tokens` instead of the configured limit if given."""
+        backend = self._resolve()
+        with span("llm.call", backend=type(backend).__name__, prompt_chars=len(prompt)) as record:
+            reply = backend.call(prompt, max_tokens=max_tokens)
+            record["reply_chars"] = len(reply or "")
+            return reply
+
+
+llm = LazyLLM()
@@ -0,0 +1,170 @@
+import os
+import atexit
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from utils.config import get_setting
+from utils.llm import llm
+from utils.metrics import count
+from utils.prompt_matcher import normalize_prompt
+
+CACHE_DB = os.path.join("history", "llm_cache.sqlite3")
+DEFAULT_MEMORY_SIZE = 256
+DEFAULT_TTL_HOURS = 24 * 14
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def make_cache_key(pairs, model, temperature, template=""):
+    """
+    Hashes a profile's prompt/answer pairs together with the generation settings.
+
+    Pairs are normalized (quotes, case, whitespace, trailing punctuation) so the same profile
+    re-shown with cosmetic differences maps to the same entry; the prompt template is part of
+    the key so editing the instructions never serves replies written for the old ones.
+    """
+    normalized = [[normalize_prompt(prompt), normalize_prompt(answer or "")] for prompt, answer in pairs]
+    payload = json.dumps([normalized, str(model), float(temperature or 0), template], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier store for generated replies: an in-memory LRU in front of a sqlite table.
+
+    Entries expire after `ttl` seconds and the table is trimmed to `max_entries`, dropping the
+    least recently used rows first. Hit/miss counters are kept per tier.
+    """
+
+    def __init__(self, db_path=CACHE_DB, memory_size=DEFAULT_MEMORY_SIZE, ttl=DEFAULT_TTL_HOURS * 3600,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._purge_expired()
+
+    def _purge_expired(self):
+        with self._lock, self._db:
+            cursor = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.stats["evictions"] += cursor.rowcount
+
+    def _remember(self, key, response, created):
+        self._memory[key] = (response, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                with self._db:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._remember(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                return row[0]
+            if row is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.stats["evictions"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, response):
+        """Stores a response, trimming the table to `max_entries` if needed."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                             (key, response, now, now))
+            self._remember(key, response, now)
+            excess = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute("DELETE FROM responses WHERE key IN "
+                                 "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,))
+                self.stats["evictions"] += excess
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedLLM:
+    """
+    Wraps an LLM object and answers repeated profiles from a ResponseCache instead of
+    making another remote call.
+    """
+
+    def __init__(self, llm, cache=None):
+        self.llm = llm
+        self.cache = cache
+        if cache is None and get_setting("llm_cache.enabled", True):
+            self.cache = ResponseCache(
+                db_path=get_setting("llm_cache.path", CACHE_DB),
+                memory_size=get_setting("llm_cache.memory_size", DEFAULT_MEMORY_SIZE),
+                ttl=get_setting("llm_cache.ttl_hours", DEFAULT_TTL_HOURS) * 3600,
+                max_entries=get_setting("llm_cache.max_entries", DEFAULT_MAX_ENTRIES),
+            )
+
+    def call(self, prompt, pairs=None, template="", max_tokens=None):
+        """
+        Returns the reply for `prompt`, generating it only on a cache miss.
+        Args:
+            prompt (str): Full text sent to the model.
+            pairs (list): The profile's (prompt, answer) tuples the reply is keyed on;
+                without them the prompt text itself is the key.
+            template (str): Prompt template, so template edits invalidate old entries.
+            max_tokens (int): Completion token limit for this call (default: the backend's).
+        """
+        if self.cache is None:
+            return self.llm.call(prompt, max_tokens=max_tokens)
+        if pairs is None:
+            pairs, template = [], prompt
+        key = make_cache_key(pairs, getattr(self.llm, "model", ""), getattr(self.llm, "temperature", 0), template)
+        response = self.cache.get(key)
+        if response is not None:
+            logging.info(f"LLM cache hit ({self.cache.stats})")
+            count("llm.cache_hits")
+            return response
+        count("llm.cache_misses")
+        response = self.llm.call(prompt, max_tokens=max_tokens)
+        if response:
+            self.cache.put(key, response)
+        return response
+
+
+_cached_llm = None
+_cached_llm_lock = threading.Lock()
+
+
+def get_cached_llm():
+    """Returns the process-wide cached LLM, opening its sqlite cache on first use."""
+    global _cached_llm
+    with _cached_llm_lock:
+        if _cached_llm is None:
+            _cached_llm = CachedLLM(llm)
+            if _cached_llm.cache is not None:
+                atexit.register(_cached_llm.cache.close)
+        return _cached_llm
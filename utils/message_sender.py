@@ -1,8 +1,10 @@
 import subprocess
-import time
 import logging
 import re
-import xml.etree.ElementTree as ET
+from utils.device import get_device
+from utils.ui_snapshot import UiSnapshot
+from utils.text_input import replace_field_text
+from utils.waits import wait_for_screen_stable, wait_for_element, wait_for_keyboard
 
 def parse_bounds(bounds):
     left_top, right_bottom = bounds.split("][")
@@ -12,85 +14,67 @@ def parse_bounds(bounds):
     y = (top + bottom) // 2
     return x, y
 
-def get_input_field_coordinates(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for node in root.iter("node"):
-        if node.attrib.get("class") == "android.widget.EditText" and node.attrib.get("clickable") == "true":
-            return parse_bounds(node.attrib["bounds"])
+def get_input_field_coordinates(ui_dump):
+    snapshot = UiSnapshot.load(ui_dump)
+    nodes = snapshot.query("input_field")
+    if nodes:
+        return parse_bounds(nodes[0].attrib["bounds"])
     return None, None
 
-def get_send_button_coordinates(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for node in root.iter("node"):
-        content_desc = node.attrib.get("content-desc", "").lower()
-        if "send priority like" in content_desc:
-            for parent in root.iter("node"):
-                if node in list(parent):
-                    if parent.attrib.get("clickable") == "true":
-                        return parse_bounds(parent.attrib["bounds"])
+def get_send_button_coordinates(ui_dump):
+    snapshot = UiSnapshot.load(ui_dump)
+    nodes = snapshot.query("send_button")
+    if nodes:
+        return parse_bounds(nodes[0].attrib["bounds"])
     return None, None
 
-def get_cancel_button_coordinates(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    for node in root.iter("node"):
-        # Check both content-desc and text attributes
-        content_desc = node.attrib.get("content-desc", "").lower()
-        text = node.attrib.get("text", "").lower()
-        if content_desc == "cancel" or text == "cancel":
-            # If we found a text node, get its parent button
-            if node.attrib.get("class") == "android.widget.TextView":
-                for parent in root.iter("node"):
-                    if node in list(parent) and parent.attrib.get("class") == "android.widget.Button":
-                        return parse_bounds(parent.attrib["bounds"])
-            return parse_bounds(node.attrib["bounds"])
-    return None, None
+def get_cancel_button_coordinates(ui_dump):
+    snapshot = UiSnapshot.load(ui_dump)
+    # Check both content-desc and text attributes
+    candidates = snapshot.query("cancel")
+    if not candidates:
+        return None, None
+    node = candidates[0]
+    # If we found a text node, get its parent button
+    if node.attrib.get("class") == "android.widget.TextView":
+        parent = snapshot.parent(node)
+        if parent is not None and parent.attrib.get("class") == "android.widget.Button":
+            return parse_bounds(parent.attrib["bounds"])
+    return parse_bounds(node.attrib["bounds"])
 
 def send_message(message):
+    snapshot = None
     try:
         logging.info('Preparing to send message...')
-        time.sleep(2)
 
-        logging.info('Dumping UI hierarchy to find input field...')
-        subprocess.run(['adb', 'shell', 'uiautomator', 'dump', '/sdcard/ui.xml'], check=True)
-        subprocess.run(['adb', 'pull', '/sdcard/ui.xml', 'ui_dump.xml'], check=True)
-        input_x, input_y = get_input_field_coordinates('ui_dump.xml')
+        logging.info('Waiting for the input field to appear...')
+        snapshot, field = wait_for_element(timeout=2, cls="android.widget.EditText", clickable=True)
+        input_x, input_y = get_input_field_coordinates(snapshot)
 
         if input_x is not None and input_y is not None:
             logging.info(f'Found input field at ({input_x}, {input_y}). Tapping it...')
-            subprocess.run(["adb", "shell", "input", "tap", str(input_x), str(input_y)], check=True)
-            time.sleep(2.5)
+            get_device().shell(f"input tap {input_x} {input_y}", check=True)
+            wait_for_keyboard(timeout=2.5)
         else:
             logging.error("Input field not found in UI dump.")
             return False
 
-        safe_message = re.sub(r'[^\x00-\x7F]', '', message)
-        safe_message = re.sub(r'[\'\"\\\\`$&|;<>]', '', safe_message)
-        safe_message = safe_message.replace('\n', ' ').replace('\r', ' ')
-        safe_message = re.sub(r'\s+', ' ', safe_message).strip()
+        # Newlines would send early; everything else is typed as written
+        text = re.sub(r'\s+', ' ', message).strip()
 
-        if not safe_message:
-            logging.error("Message is empty after sanitization")
+        if not text:
+            logging.error("Message is empty")
             return False
 
-        logging.info(f'Clearing input field...')
-        subprocess.run(["adb", "shell", "input", "keyevent", "67"], check=True)  # Clear the input field
-        time.sleep(0.2)
-        max_length = 100
-        for i in range(0, len(safe_message), max_length):
-            chunk = safe_message[i:i+max_length]
-            chunk = chunk.replace(' ', '%s')
-            subprocess.run(["adb", "shell", "input", "text", chunk], check=True)
-            time.sleep(0.2)
+        logging.info('Replacing input field text with the message...')
+        replace_field_text(text, field.attrib.get("text", "") if field is not None else "")
 
-        send_x, send_y = get_send_button_coordinates('ui_dump.xml')
+        send_x, send_y = get_send_button_coordinates(snapshot)
 
         if send_x is not None and send_y is not None:
             logging.info(f'Tapping send button at ({send_x}, {send_y})...')
-            time.sleep(1)
-            subprocess.run(["adb", "shell", "input", "tap", str(send_x), str(send_y)], check=True)
+            wait_for_screen_stable(timeout=1)
+            get_device().shell(f"input tap {send_x} {send_y}", check=True)
             return True
         else:
             logging.error("Send button not found.")
@@ -99,20 +83,20 @@ def send_message(message):
     except subprocess.CalledProcessError as e:
         logging.error(f"ADB command failed: {e}")
         # Attempt to close the dialog by clicking the cancel button
-        cancel_x, cancel_y = get_cancel_button_coordinates('ui_dump.xml')
+        cancel_x, cancel_y = get_cancel_button_coordinates(snapshot) if snapshot else (None, None)
         if cancel_x is not None and cancel_y is not None:
             logging.info(f'Attempting to close dialog by tapping cancel button at ({cancel_x}, {cancel_y})...')
-            subprocess.run(["adb", "shell", "input", "tap", str(cancel_x), str(cancel_y)], check=True)
+            get_device().shell(f"input tap {cancel_x} {cancel_y}", check=True)
             return False
         else:
             logging.error("Cancel button not found.")
             return False
     except Exception as e:
-        cancel_x, cancel_y = get_cancel_button_coordinates('ui_dump.xml')
+        cancel_x, cancel_y = get_cancel_button_coordinates(snapshot) if snapshot else (None, None)
         if cancel_x is not None and cancel_y is not None:
             logging.info(f'Attempting to close dialog by tapping cancel button at ({cancel_x}, {cancel_y})...')
-            subprocess.run(["adb", "shell", "input", "tap", str(cancel_x), str(cancel_y)], check=True)
+            get_device().shell(f"input tap {cancel_x} {cancel_y}", check=True)
             return False
         else:
             logging.error("Cancel button not found.")
-            return Fals
+            return False
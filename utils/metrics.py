@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import logging.handlers
+from collections import deque
+from contextlib import contextmanager
+from utils.config import get_setting
+
+METRICS_FILE = os.path.join("history", "metrics.jsonl")
+TEXTFILE = os.path.join("history", "metrics.prom")
+DEFAULT_MAX_MB = 10
+DEFAULT_BACKUPS = 3
+# Durations kept per span for percentiles; older ones only count towards totals
+MAX_SAMPLES = 10000
+PROMETHEUS_PREFIX = "hinge_genie"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _metric_name(name):
+    return name.replace(".", "_").replace("-", "_")
+
+
+class Metrics:
+    """
+    Timing spans and counters for bot cycles, ADB commands and LLM calls.
+
+    Every finished span is appended as one JSON line to a size-rotated file, tagged with the
+    current cycle number. Per-span durations, failures and byte counts are aggregated in
+    memory for export() (a Prometheus textfile) and summary(), which is logged on close().
+    """
+
+    def __init__(self, path=METRICS_FILE, textfile=TEXTFILE, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 backups=DEFAULT_BACKUPS, enabled=True):
+        self.enabled = enabled
+        self.textfile = textfile
+        self.cycle = 0
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._closed = False
+        self._log = None
+        if enabled and path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log = logging.getLogger(f"hinge_genie.metrics.{id(self)}")
+            self._log.setLevel(logging.INFO)
+            self._log.propagate = False
+            self._log.addHandler(handler)
+
+    def start_cycle(self):
+        """Starts a new bot cycle; later events are tagged with its number."""
+        with self._lock:
+            self.cycle += 1
+            return self.cycle
+
+    @contextmanager
+    def span(self, name, **fields):
+        """
+        Times the enclosed block as span `name`. Yields a dict the block can add fields to;
+        `bytes` is summed per span and `ok=False` counts as a failure (as does an exception).
+        """
+        record = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["ok"] = False
+            record.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            self._finish(name, time.perf_counter() - start, record)
+
+    def _finish(self, name, duration, record):
+        if not self.enabled:
+            return
+        ok = record.pop("ok", True) is not False
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {"count": 0, "failures": 0, "total": 0.0, "bytes": 0,
+                                             "samples": deque(maxlen=MAX_SAMPLES)}
+            stats["count"] += 1
+            stats["failures"] += not ok
+            stats["total"] += duration
+            stats["bytes"] += record.get("bytes", 0)
+            stats["samples"].append(duration)
+            cycle = self.cycle
+        if self._log is not None:
+            event = {"ts": round(time.time(), 3), "cycle": cycle, "span": name, "seconds": round(duration, 6),
+                     "ok": ok}
+            event.update(record)
+            self._log.info(json.dumps(event, ensure_ascii=False, default=str))
+
+    def count(self, name, value=1):
+        """Adds `value` to counter `name` (e.g. llm.prompt_tokens)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def summary(self):
+        """Returns {span: {count, failures, p50, p95, max, total, bytes}} and the counters."""
+        with self._lock:
+            spans = {}
+            for name, stats in self._spans.items():
+                samples = sorted(stats["samples"])
+                spans[name] = {
+                    "count": stats["count"], "failures": stats["failures"], "bytes": stats["bytes"],
+                    "p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95),
+                    "max": samples[-1] if samples else 0.0, "total": stats["total"],
+                }
+            return spans, dict(self._counters)
+
+    def export(self):
+        """Writes the aggregates as a Prometheus textfile (for node_exporter's textfile collector)."""
+        if not self.enabled or not self.textfile:
+            return
+        spans, counters = self.summary()
+        p = PROMETHEUS_PREFIX
+        lines = [f"# HELP {p}_span_seconds Duration of bot stages and device/LLM calls",
+                 f"# TYPE {p}_span_seconds summary"]
+        for name, s in sorted(spans.items()):
+            for quantile in ("0.5", "0.95"):
+                lines.append(f'{p}_span_seconds{{span="{name}",quantile="{quantile}"}} '
+                             f'{s["p50" if quantile == "0.5" else "p95"]:.6f}')
+            lines.append(f'{p}_span_seconds_sum{{span="{name}"}} {s["total"]:.6f}')
+            lines.append(f'{p}_span_seconds_count{{span="{name}"}} {s["count"]}')
+        lines += [f"# HELP {p}_span_failures_total Spans that failed", f"# TYPE {p}_span_failures_total counter"]
+        lines += [f'{p}_span_failures_total{{span="{name}"}} {s["failures"]}' for name, s in sorted(spans.items())]
+        lines += [f"# HELP {p}_span_bytes_total Bytes transferred within spans", f"# TYPE {p}_span_bytes_total counter"]
+        lines += [f'{p}_span_bytes_total{{span="{name}"}} {s["bytes"]}' for name, s in sorted(spans.items()) if s["bytes"]]
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {p}_{_metric_name(name)}_total counter", f"{p}_{_metric_name(name)}_total {value}"]
+        os.makedirs(os.path.dirname(self.textfile) or ".", exist_ok=True)
+        # Write-then-rename so the collector never reads a half-written file
+        with open(self.textfile + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(self.textfile + ".tmp", self.textfile)
+
+    def format_summary(self):
+        spans, counters = self.summary()
+        lines = [f"{'span':28} {'count':>6} {'fail':>5} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'total s':>9}"]
+        for name, s in sorted(spans.items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"{name:28} {s['count']:>6} {s['failures']:>5} {s['p50']:>8.3f} {s['p95']:>8.3f} "
+                         f"{s['max']:>8.3f} {s['total']:>9.2f}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:28} {value:>6}")
+        return "\n".join(lines)
+
+    def close(self):
+        """Exports the textfile and logs the summary. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        if not self.enabled:
+            return
+        self.export()
+        if self._spans:
+            logging.info(f"Metrics summary ({self.cycle} cycles):\n{self.format_summary()}")
+        if self._log is not None:
+            for handler in self._log.handlers:
+                handler.close()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Returns the process-wide metrics collector, creating it on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(
+                path=get_setting("metrics.path", METRICS_FILE),
+                textfile=get_setting("metrics.textfile", TEXTFILE),
+                max_bytes=get_setting("metrics.max_mb", DEFAULT_MAX_MB) * 1024 * 1024,
+                backups=get_setting("metrics.backups", DEFAULT_BACKUPS),
+                enabled=get_setting("metrics.enabled", True),
+            )
+            atexit.register(_metrics.close)
+        return _metrics
+
+
+def span(name, **fields):
+    """Shorthand for get_metrics().span(name, **fields)."""
+    return get_metrics().span(name, **fields)
+
+
+def count(name, value=1):
+    """Shorthand for get_metrics().count(name, value)."""
+    get_metrics().count(name, value)
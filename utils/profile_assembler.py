@@ -0,0 +1,118 @@
+import logging
+from collections import Counter
+from utils.ui_snapshot import UiSnapshot, BOUNDS_RE
+
+# How far (px) matched nodes may drift from the estimated scroll offset and still count as the same node
+BOUNDS_TOLERANCE = 8
+
+
+def visible_text_nodes(ui_dump):
+    """
+    Returns the (text, bounds) of every node with text in a UI dump (XML bytes, file path or
+    UiSnapshot), in document order.
+    """
+    snapshot = ui_dump if isinstance(ui_dump, UiSnapshot) else UiSnapshot.load(ui_dump)
+    items = []
+    for node in snapshot.query("text_nodes"):
+        text = node.attrib.get('text', '').strip()
+        if not text:
+            continue
+        match = BOUNDS_RE.match(node.attrib.get('bounds', ''))
+        if match:
+            items.append((text, tuple(map(int, match.groups()))))
+    return items
+
+
+def _same_node(prev, item, dy):
+    """Whether `item` in the new window is `prev` from the previous window shifted up by `dy`."""
+    (ptext, (pl, pt, pr, pb)), (text, (l, t, r, b)) = prev, item
+    if ptext != text or pl != l or pr != r:
+        return False
+    # A node clipped by the screen edge keeps only one of its edges, so either may match
+    return abs(pt - (t + dy)) <= BOUNDS_TOLERANCE or abs(pb - (b + dy)) <= BOUNDS_TOLERANCE
+
+
+def _scroll_offset(prev_items, items):
+    """Estimates how far the content moved up between two windows, or None if they don't overlap."""
+    prev_by_text = {}
+    for text, bounds in prev_items:
+        prev_by_text.setdefault(text, []).append(bounds)
+    offsets = Counter()
+    for text, (l, t, r, b) in items:
+        for pl, pt, pr, pb in prev_by_text.get(text, ()):
+            if pl == l and pr == r and pt > t:
+                offsets[pt - t] += 1
+    if not offsets:
+        return None
+    return offsets.most_common(1)[0][0]
+
+
+def _distinct_windows(windows):
+    # Identical consecutive windows mean the scroll didn't move (end of profile)
+    return [items for i, items in enumerate(windows) if i == 0 or set(items) != set(windows[i - 1])]
+
+
+def _chrome(windows):
+    """Nodes at identical bounds in consecutive windows: fixed header, tab bar, Skip button."""
+    chrome = set()
+    for prev_items, items in zip(windows, windows[1:]):
+        chrome.update(set(prev_items) & set(items))
+    return chrome
+
+
+def scroll_offsets(windows):
+    """
+    Returns how far (px) the content moved between each pair of consecutive scroll windows,
+    with None for pairs that share no content.
+    """
+    windows = _distinct_windows(windows)
+    chrome = _chrome(windows)
+    return [_scroll_offset([item for item in prev_items if item not in chrome],
+                           [item for item in items if item not in chrome])
+            for prev_items, items in zip(windows, windows[1:])]
+
+
+def merge_windows(windows):
+    """
+    Merges overlapping scroll windows into one ordered list of content texts.
+
+    Nodes that sit at identical bounds in consecutive windows are fixed chrome (header, tab bar,
+    Skip button) and are dropped. Everything else is matched against the previous window by text
+    and by bounds shifted by the estimated scroll offset; only nodes not seen before are appended.
+    Args:
+        windows (list): Per-window lists of (text, bounds) tuples, in capture order.
+    Returns:
+        List of texts in on-screen order with overlaps removed.
+    """
+    windows = _distinct_windows(windows)
+    if not windows:
+        return []
+    if len(windows) == 1:
+        return [text for text, _ in windows[0]]
+
+    chrome = _chrome(windows)
+
+    merged = [text for text, bounds in windows[0] if (text, bounds) not in chrome]
+    for index, (prev_items, items) in enumerate(zip(windows, windows[1:]), start=2):
+        prev_content = [item for item in prev_items if item not in chrome]
+        content = [item for item in items if item not in chrome]
+        dy = _scroll_offset(prev_content, content)
+        if dy is None:
+            logging.warning(f"No overlap found between window {index - 1} and {index}; appending it whole.")
+            merged.extend(text for text, _ in content)
+            continue
+        merged.extend(text for text, bounds in content
+                      if not any(_same_node(prev, (text, bounds), dy) for prev in prev_content))
+    return merged
+
+
+def dedupe_pairs(pairs):
+    """
+    Collapses repeated prompts into one entry, keeping the first position and the first
+    non-empty answer seen for it.
+    """
+    answers = {}
+    for prompt, answer in pairs:
+        if prompt not in answers or answers[prompt] is None:
+            answers[prompt] = answer
+    return list(answers.items())
@@ -1,5 +1,14 @@
 import os
-import xml.etree.ElementTree as ET
+import re
+from utils.ui_snapshot import UiSnapshot
+
+
+def dump_sort_key(fname):
+    """
+    Sort key that orders dump_2.xml before dump_10.xml (capture order, not lexical order).
+    """
+    match = re.search(r'(\d+)', fname)
+    return (int(match.group(1)) if match else -1, fname)
 
 
 def load_known_prompts(prompts_file):
@@ -15,38 +24,53 @@ def load_known_prompts(prompts_file):
     return prompts
 
 
-def extract_prompt_response_pairs_from_xml(xml_path, known_prompts):
+def extract_prompt_response_pairs(texts, known_prompts, lookahead=3):
     """
-    Parses a Hinge UI dump XML file and extracts prompt-response pairs.
+    Pairs each known prompt in a sequence of node texts with the response that follows it.
     Args:
-        xml_path (str): Path to the UI dump XML file.
-        known_prompts (set): Set of known prompt strings.
+        texts (list): Node texts in on-screen order.
+        known_prompts (set or PromptMatcher): Known prompts; a matcher also recognises
+            typographic variants and reports the canonical prompt.
+        lookahead (int): How many following nodes to search for the response.
     Returns:
-        List of (prompt, response) tuples.
+        List of (prompt, response) tuples; response is None if none was found.
     """
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    nodes = list(root.iter('node'))
+    match = getattr(known_prompts, 'match', None)
+    if match is None:
+        match = lambda text: text if text in known_prompts else None
     pairs = []
     i = 0
-    while i < len(nodes):
-        node = nodes[i]
-        text = node.attrib.get('text', '').strip()
-        if text in known_prompts:
+    while i < len(texts):
+        prompt = match(texts[i]) if texts[i] else None
+        if prompt is not None:
             # Try to find the next non-empty text node as the response
             response = None
-            for j in range(i+1, min(i+4, len(nodes))):
-                rtext = nodes[j].attrib.get('text', '').strip()
-                if rtext and rtext not in known_prompts:
+            j = i + 1
+            for j in range(i+1, min(i+1+lookahead, len(texts))):
+                rtext = texts[j]
+                if rtext and match(rtext) is None:
                     response = rtext
                     break
-            pairs.append((text, response))
-            i = j  # Skip to after the response
+            pairs.append((prompt, response))
+            i = max(j, i + 1)  # Skip to after the response
         else:
             i += 1
     return pairs
 
 
+def extract_prompt_response_pairs_from_xml(xml_path, known_prompts):
+    """
+    Parses a Hinge UI dump XML file and extracts prompt-response pairs.
+    Args:
+        xml_path (str or bytes): Path to the UI dump XML file, or the raw XML bytes.
+        known_prompts (set): Set of known prompt strings.
+    Returns:
+        List of (prompt, response) tuples.
+    """
+    texts = [text.strip() for text in UiSnapshot.load(xml_path).query("texts")]
+    return extract_prompt_response_pairs(texts, known_prompts)
+
+
 def extract_prompts_from_multiple_xml(xml_dir, prompts_file):
     """
     Extracts all prompt-response pairs from all XML files in a directory.
@@ -58,7 +82,7 @@ def extract_prompts_from_multiple_xml(xml_dir, prompts_file):
     """
     known_prompts = load_known_prompts(prompts_file)
     result = {}
-    for fname in os.listdir(xml_dir):
+    for fname in sorted(os.listdir(xml_dir), key=dump_sort_key):
         if fname.endswith('.xml'):
             xml_path = os.path.join(xml_dir, fname)
             pairs = extract_prompt_response_pairs_from_xml(xml_path, known_prompts)
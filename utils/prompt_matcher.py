@@ -0,0 +1,179 @@
+import os
+import re
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from utils.prompt_extractor import load_known_prompts
+
+# Typographic variants the app (or our prompt list) may use for the same character
+CHAR_MAP = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'",
+    "“": '"', "”": '"', "„": '"', "″": '"',
+    "–": "-", "—": "-", "−": "-",
+    " ": " ",
+})
+TRAILING_PUNCT_RE = re.compile(r"[\s.,:;!?…]+$")
+WHITESPACE_RE = re.compile(r"\s+")
+ELLIPSIS_RE = re.compile(r"(\.\.\.|…)\s*$")
+
+# A prefix must be this long to match; without a trailing ellipsis it must also cover this share of the prompt
+MIN_PREFIX_LEN = 10
+MIN_PREFIX_RATIO = 0.8
+# Fuzzy matching is skipped for short texts, which are mostly answers like "Woman" or "23"
+MIN_FUZZY_LEN = 8
+MAX_EDIT_DISTANCE = 3
+# Bound on remembered lookups (screen texts repeat a lot between windows and profiles)
+CACHE_SIZE = 4096
+
+_END = ""
+GRAM = 3
+
+
+def normalize_prompt(text):
+    """Folds quotes, dashes, case, whitespace and trailing punctuation so prompt variants compare equal."""
+    text = unicodedata.normalize("NFKC", text).translate(CHAR_MAP).casefold()
+    text = WHITESPACE_RE.sub(" ", text).strip()
+    return TRAILING_PUNCT_RE.sub("", text)
+
+
+def trigrams(key):
+    """Distinct character trigrams of a normalized key."""
+    return {key[i:i + GRAM] for i in range(len(key) - GRAM + 1)}
+
+
+def edit_distance(a, b, max_distance):
+    """Levenshtein distance between a and b, or max_distance + 1 once it is known to exceed it."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class PromptMatcher:
+    """
+    Maps on-screen texts to known Hinge prompts.
+
+    Lookups try, in order: an exact hit on the normalized text; a trie walk for texts the app
+    truncated ("My most irrational fear is th…"); and a bounded edit-distance search among
+    prompts sharing enough trigrams with the text. Results, including misses, are memoized per raw text, so the
+    common case is a single dict lookup.
+    Supports `text in matcher` like the plain prompt set it replaces.
+    """
+
+    def __init__(self, prompts):
+        self.prompts = sorted(set(prompts))
+        self._exact = {}
+        self._lengths = {}
+        self._grams = {}
+        self._trie = {}
+        for prompt in self.prompts:
+            key = normalize_prompt(prompt)
+            if not key or key in self._exact:
+                continue
+            self._exact[key] = prompt
+            self._lengths[key] = len(key)
+            for gram in trigrams(key):
+                self._grams.setdefault(gram, []).append(key)
+            self._insert(key, prompt)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.prompts)
+
+    def __contains__(self, text):
+        return self.match(text) is not None
+
+    def _insert(self, key, prompt):
+        # Every trie node remembers the single prompt below it, or None once it is ambiguous
+        node = self._trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+            node[_END] = prompt if node.get(_END, prompt) == prompt else None
+
+    def _prefix_match(self, key, truncated):
+        node = self._trie
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                return None
+        prompt = node.get(_END)
+        # Without an ellipsis, a short prefix is more likely an answer than a cut-off prompt
+        if prompt is not None and (truncated or len(key) >= MIN_PREFIX_RATIO * len(normalize_prompt(prompt))):
+            return prompt
+        return None
+
+    def _fuzzy_match(self, key):
+        max_distance = min(MAX_EDIT_DISTANCE, max(1, len(key) // 12))
+        # Each edit destroys at most GRAM trigrams, so a prompt within max_distance must share
+        # at least this many; only those few candidates get the full edit-distance check.
+        grams = trigrams(key)
+        needed = len(grams) - GRAM * max_distance
+        if needed <= 0:
+            return None
+        shared = Counter(candidate for gram in grams for candidate in self._grams.get(gram, ()))
+        best, best_distance = None, max_distance + 1
+        for candidate, count in shared.items():
+            if count < needed or abs(self._lengths[candidate] - len(key)) > max_distance:
+                continue
+            distance = edit_distance(key, candidate, best_distance - 1)
+            if distance < best_distance:
+                best, best_distance = self._exact[candidate], distance
+        return best
+
+    def _lookup(self, text):
+        key = normalize_prompt(text)
+        if not key:
+            return None
+        prompt = self._exact.get(key)
+        if prompt is not None:
+            return prompt
+        if len(key) >= MIN_PREFIX_LEN:
+            prompt = self._prefix_match(key, truncated=bool(ELLIPSIS_RE.search(text)))
+            if prompt is not None:
+                return prompt
+        if len(key) >= MIN_FUZZY_LEN:
+            return self._fuzzy_match(key)
+        return None
+
+    def match(self, text):
+        """Returns the canonical known prompt `text` shows, or None if it isn't a prompt."""
+        try:
+            return self._cache[text]
+        except KeyError:
+            pass
+        prompt = self._lookup(text)
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[text] = prompt
+        return prompt
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_prompt_matcher(prompts_file):
+    """
+    Returns the matcher for a prompts file, building it once per process and rebuilding it
+    only when the file's modification time or size changes.
+    """
+    stat = os.stat(prompts_file)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _matchers_lock:
+        cached = _matchers.get(prompts_file)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        matcher = PromptMatcher(load_known_prompts(prompts_file))
+        _matchers[prompts_file] = (signature, matcher)
+        logging.info(f"Loaded {len(matcher)} known prompts from {prompts_file}")
+        return matcher
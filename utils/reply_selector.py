@@ -0,0 +1,187 @@
+import re
+import json
+import logging
+import subprocess
+import threading
+import unicodedata
+from utils.config import get_setting
+from utils.history_store import get_history_store
+from utils.metrics import count
+from utils.text_input import ASCII_REPLACEMENTS, adb_keyboard_active, to_ascii
+
+DEFAULT_CANDIDATES = 4
+DEFAULT_MAX_CHARS = 140
+# Character-trigram overlap with an earlier reply above which a candidate counts as a repeat
+DEFAULT_MAX_SIMILARITY = 0.6
+# Earlier replies compared against
+DEFAULT_HISTORY_SIZE = 200
+_JSON = json.JSONDecoder()
+LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+QUOTES = "\"'“”‘’`"
+
+
+def parse_candidates(text):
+    """
+    Reads the replies out of a model answer: a JSON array of strings if there is one, else one
+    reply per line of a numbered/bulleted list, else the whole answer as a single reply.
+    """
+    if not text:
+        return []
+    # Decode from each "[" in turn, so brackets in prose before or after the array don't matter
+    start = text.find("[")
+    while start >= 0:
+        try:
+            items, _ = _JSON.raw_decode(text, start)
+        except ValueError:
+            items = None
+        # A list with no strings is a citation or footnote mark, not the replies
+        if isinstance(items, list) and any(isinstance(i, str) for i in items):
+            return [item for item in (i.strip() for i in items if isinstance(i, str)) if item]
+        start = text.find("[", start + 1)
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) > 1 and all(LIST_MARKER_RE.match(line) for line in lines):
+        return [LIST_MARKER_RE.sub("", line).strip() for line in lines]
+    return [text.strip()]
+
+
+def is_emoji(ch):
+    return ord(ch) >= 0x1F000 or unicodedata.category(ch) == "So" or ch in "\u200d\ufe0f"
+
+
+def clean(reply):
+    """The reply as it would be typed: whitespace collapsed, wrapping quotes dropped."""
+    reply = re.sub(r"\s+([,.!?])", r"\1", re.sub(r"\s+", " ", reply)).strip()
+    if len(reply) > 1 and reply[0] in QUOTES and reply[-1] in QUOTES:
+        reply = reply[1:-1].strip()
+    return reply
+
+
+def problems(reply, max_chars=DEFAULT_MAX_CHARS, ascii_only=True):
+    """
+    Hard rule violations of an already cleaned reply; empty when it can be sent as is.
+    Pass ascii_only=False when the text is typed through ADBKeyboard, which takes any Unicode.
+    """
+    if not reply:
+        return ["empty"]
+    found = []
+    if len(reply) > max_chars:
+        found.append("too_long")
+    if not reply.endswith("?"):
+        found.append("no_question")
+    if any(is_emoji(ch) for ch in reply):
+        found.append("emoji")
+    # Typographic quotes and dashes are straightened when typed; anything else non-ASCII may be lost
+    elif ascii_only and any(ord(ASCII_REPLACEMENTS.get(ch, ch)[0]) > 127 for ch in reply):
+        found.append("non_ascii")
+    return found
+
+
+def repair(reply, max_chars=DEFAULT_MAX_CHARS, ascii_only=True):
+    """
+    Fixes what can be fixed mechanically: drops emoji, types non-ASCII as ASCII (when
+    `ascii_only`) and, when too long, cuts after the last question that still fits (or at a
+    word boundary).
+    """
+    reply = "".join(ch for ch in reply if not is_emoji(ch))
+    reply = clean(to_ascii(reply) if ascii_only else reply)
+    if len(reply) > max_chars:
+        head = reply[:max_chars]
+        if "?" in head:
+            reply = head[:head.rfind("?") + 1]
+        else:
+            reply = head.rsplit(" ", 1)[0]
+    return reply
+
+
+def _shingles(text):
+    text = re.sub(r"[^a-z0-9 ]", "", text.lower())
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ReplySelector:
+    """
+    Picks the reply to send from several generated candidates.
+
+    Every candidate is checked against the rules the prompt states (length, trailing question,
+    no emoji, typeable as ASCII unless ADBKeyboard does the typing) and compared with the most recent replies already sent, using
+    character-trigram overlap. The least repetitive valid candidate wins; if none is valid,
+    mechanically repaired versions are tried before settling for the closest one.
+    """
+
+    def __init__(self, store=None, max_chars=None, max_similarity=None, history_size=None):
+        self.max_chars = max_chars or get_setting("gpt.max_reply_chars", DEFAULT_MAX_CHARS)
+        self.max_similarity = get_setting("gpt.max_similarity", DEFAULT_MAX_SIMILARITY) \
+            if max_similarity is None else max_similarity
+        self.history_size = history_size or get_setting("gpt.similarity_history", DEFAULT_HISTORY_SIZE)
+        self._lock = threading.Lock()
+        self._recent = [_shingles(reply) for reply in (store or get_history_store()).recent_replies(self.history_size)]
+
+    def remember(self, reply):
+        """Adds a sent reply to the ones later candidates must not repeat."""
+        with self._lock:
+            self._recent.insert(0, _shingles(reply))
+            del self._recent[self.history_size:]
+
+    def similarity(self, reply):
+        """Highest trigram Jaccard similarity between `reply` and a recent reply (0 to 1)."""
+        grams = _shingles(reply)
+        if not grams:
+            return 0.0
+        with self._lock:
+            recent = list(self._recent)
+        return max((len(grams & other) / len(grams | other) for other in recent if other), default=0.0)
+
+    def ascii_only(self):
+        """Whether replies must be plain ASCII, i.e. ADBKeyboard is not there to type Unicode."""
+        try:
+            return not adb_keyboard_active()
+        except (subprocess.SubprocessError, OSError) as e:
+            logging.warning(f"Could not check the input method, assuming ASCII-only typing: {e}")
+            return True
+
+    def assess(self, reply, ascii_only=True):
+        """Returns (problems, similarity) for a cleaned reply; a repeat of a recent reply is a problem too."""
+        found = problems(reply, self.max_chars, ascii_only)
+        similarity = self.similarity(reply)
+        if similarity > self.max_similarity:
+            found.append("repeat")
+        return found, similarity
+
+    def select(self, candidates):
+        """Returns the best reply among `candidates` (cleaned), or None if there are none."""
+        ascii_only = self.ascii_only()
+        assessed = []
+        for index, candidate in enumerate(clean(c) for c in candidates):
+            found, similarity = self.assess(candidate, ascii_only)
+            assessed.append((len(found), similarity, index, candidate, found))
+        count("llm.candidates", len(assessed))
+        valid = [a for a in assessed if not a[0]]
+        count("llm.candidates_valid", len(valid))
+        if not valid:
+            for _, _, index, candidate, _ in list(assessed):
+                fixed = repair(candidate, self.max_chars, ascii_only)
+                found, similarity = self.assess(fixed, ascii_only)
+                assessed.append((len(found), similarity, index, fixed, found))
+            if any(not a[0] for a in assessed):
+                count("llm.replies_repaired")
+        if not assessed:
+            return None
+        problem_count, similarity, _, best, found = min(assessed, key=lambda a: a[:3])
+        if problem_count:
+            logging.warning(f"No generated reply meets every rule; using one with {', '.join(found)}")
+        logging.info(f"Picked reply from {len(candidates)} candidate(s), {len(valid)} valid, "
+                     f"similarity to earlier replies {similarity:.2f}")
+        return best
+
+
+_selector = None
+_selector_lock = threading.Lock()
+
+
+def get_reply_selector():
+    """Returns the process-wide reply selector, loading recent replies on first use."""
+    global _selector
+    with _selector_lock:
+        if _selector is None:
+            _selector = ReplySelector()
+        return _selector
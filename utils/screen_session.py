@@ -0,0 +1,94 @@
+import time
+import logging
+import threading
+from utils.device import get_device
+from utils.ui_snapshot import UiSnapshot
+
+
+class ScreenSession:
+    """
+    Owns the current screen state: the latest UI dump and its UiSnapshot.
+
+    Readers get the cached snapshot for as long as nothing has been sent to the device that
+    changes the screen (tap, swipe, text, intent), which the device tracks in its
+    `generation` counter. The next read after such a command re-dumps. `max_age` bounds how
+    long a snapshot is trusted on its own, for screens that change without our input.
+    """
+
+    def __init__(self, device=None, max_age=None):
+        self._device = device
+        self.max_age = max_age
+        self.stats = {"dumps": 0, "reused": 0}
+        self._lock = threading.Lock()
+        self._xml = None
+        self._snapshot = None
+        self._key = None
+        self._captured = 0.0
+
+    @property
+    def device(self):
+        return self._device or get_device()
+
+    def _state_key(self, device):
+        generation = getattr(device, "generation", None)
+        # Devices that do not track generations never get their snapshots reused
+        return None if generation is None else (id(device), generation)
+
+    def _fresh(self, device):
+        if self._xml is None or self._key is None or self._key != self._state_key(device):
+            return False
+        return self.max_age is None or time.monotonic() - self._captured <= self.max_age
+
+    def invalidate(self):
+        """Forgets the cached screen, e.g. after something changed it behind the device's back."""
+        with self._lock:
+            self._xml = self._snapshot = self._key = None
+
+    def refresh(self):
+        """Dumps the screen now, whether or not the cached one is current, and returns the XML bytes."""
+        device = self.device
+        with self._lock:
+            key = self._state_key(device)
+            xml = device.dump_ui()
+            self._xml, self._snapshot, self._key = xml, None, key
+            self._captured = time.monotonic()
+            self.stats["dumps"] += 1
+            return xml
+
+    def xml(self):
+        """Returns the current screen's XML bytes, dumping only if the cached one is stale."""
+        with self._lock:
+            if self._fresh(self.device):
+                self.stats["reused"] += 1
+                logging.debug("Reusing current UI dump")
+                return self._xml
+        return self.refresh()
+
+    def _parse(self, xml):
+        with self._lock:
+            if self._snapshot is not None and self._xml is xml:
+                return self._snapshot
+        snapshot = UiSnapshot.load(xml)
+        with self._lock:
+            if self._xml is xml:
+                self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        """Returns the current screen's UiSnapshot, dumping and parsing only if needed."""
+        return self._parse(self.xml())
+
+    def refresh_snapshot(self):
+        """Like refresh(), returning the parsed UiSnapshot."""
+        return self._parse(self.refresh())
+
+
+_session = None
+
+
+def get_screen_session():
+    """Returns the process-wide screen session (it follows whatever get_device() returns)."""
+    global _session
+    if _session is None:
+        _session = ScreenSession()
+    return _session
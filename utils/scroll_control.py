@@ -0,0 +1,211 @@
+import re
+import hashlib
+import logging
+import subprocess
+import threading
+from utils.config import get_setting
+from utils.device import get_device
+from utils.screen_session import get_screen_session
+from utils.waits import settled_fingerprint, screen_fingerprint
+from utils.metrics import span
+
+SWIPE_X = 500
+SWIPE_DURATION = 300
+# The fixed gestures used before anything is learned about the device
+DEFAULT_SWIPE_START = 1500
+DEFAULT_SWIPE_DISTANCE = 700
+BACK_SWIPE = f"input swipe {SWIPE_X} 800 {SWIPE_X} 1500 {SWIPE_DURATION}"
+MIN_SWIPE_DISTANCE = 300
+# Swipes start this far down the screen and end no higher than MAX_SWIPE_FRACTION above it
+SWIPE_START_FRACTION = 0.78
+MAX_SWIPE_FRACTION = 0.65
+# Part of the screen height the content should move per swipe; the rest overlaps the
+# previous window so merge_windows can line the two up
+DEFAULT_STEP_FRACTION = 0.45
+DEFAULT_MAX_DUMPS = 12
+DEFAULT_MAX_TOP_SWIPES = 12
+# Attempts per window before a dump that keeps failing is skipped
+DUMP_ATTEMPTS = 2
+# Weight of the newest profile's measurement in the learned swipe gain
+LEARNING_RATE = 0.3
+# Gain bump after a window pair that shared no content (the step overshot the overlap)
+OVERSHOOT_FACTOR = 1.25
+# The root node of a dump spans the whole screen
+ROOT_BOUNDS_RE = re.compile(rb'bounds="\[0,0\]\[(\d+),(\d+)\]"')
+
+
+class ScrollController:
+    """
+    Scrolls by what is on screen instead of by fixed swipe counts.
+
+    Scrolling stops as soon as a swipe leaves the screen unchanged (top or end of the profile).
+    From the scroll offsets measured between consecutive windows it learns how far content
+    moves per pixel swiped, and sizes the next profile's swipes so every window moves a fixed
+    part of the screen while still overlapping the previous one. It also remembers how many
+    swipes the last profile took, so scrolling back up starts with that many in one burst.
+    """
+
+    def __init__(self, device=None):
+        self._device = device
+        self.gain = None
+        self.screen_height = None
+        self.distance = DEFAULT_SWIPE_DISTANCE
+        self.last_length = None
+        self.reached_end = False
+        self._lock = threading.Lock()
+
+    @property
+    def device(self):
+        return self._device or get_device()
+
+    def observe_dump(self, ui_xml):
+        """Takes the screen height from a dump's root node the first time one is seen."""
+        if self.screen_height is None:
+            match = ROOT_BOUNDS_RE.search(ui_xml)
+            if match:
+                self.screen_height = int(match.group(2))
+
+    def swipe_distance(self):
+        """Pixels to swipe so content moves `scroll.step_fraction` of the screen."""
+        with self._lock:
+            return self._distance()
+
+    def _distance(self):
+        # Caller holds self._lock
+        if self.gain is None or self.screen_height is None:
+            return DEFAULT_SWIPE_DISTANCE
+        step = get_setting("scroll.step_fraction", DEFAULT_STEP_FRACTION) * self.screen_height
+        longest = int(MAX_SWIPE_FRACTION * self.screen_height)
+        return max(MIN_SWIPE_DISTANCE, min(longest, int(step / self.gain)))
+
+    def _swipe_start(self):
+        if self.screen_height is None:
+            return DEFAULT_SWIPE_START
+        return int(SWIPE_START_FRACTION * self.screen_height)
+
+    def swipe_forward(self, distance):
+        start = self._swipe_start()
+        self.device.shell(f"input swipe {SWIPE_X} {start} {SWIPE_X} {start - distance} {SWIPE_DURATION}")
+
+    def learn(self, offsets):
+        """
+        Updates the swipe gain from the offsets (see profile_assembler.scroll_offsets) measured
+        over the last capture, which swiped `self.distance` pixels each time.
+        """
+        if not get_setting("scroll.learn", True):
+            return
+        # The swipe that reached the end moved only as far as the content went
+        if self.reached_end:
+            offsets = offsets[:-1]
+        measured = [dy / self.distance for dy in offsets if dy]
+        with self._lock:
+            if None in offsets and self.gain is not None:
+                self.gain *= OVERSHOOT_FACTOR
+            elif measured:
+                gain = sum(measured) / len(measured)
+                self.gain = gain if self.gain is None else (1 - LEARNING_RATE) * self.gain + LEARNING_RATE * gain
+            if self.gain is not None:
+                logging.debug(f"Scroll gain {self.gain:.2f}; next swipe {self._distance()}px")
+
+    def capture(self, on_dump, max_dumps=None, delay=1.2):
+        """
+        Dumps the screen, swipes and repeats until a swipe leaves the screen unchanged or
+        `max_dumps` dumps were taken. Calls on_dump(index, xml_bytes) for every distinct
+        dump and returns how many there were.
+        """
+        max_dumps = max_dumps or get_setting("scroll.max_dumps", DEFAULT_MAX_DUMPS)
+        session = get_screen_session()
+        device = self.device
+        fingerprint = screen_fingerprint(device)
+        previous_digest = None
+        count = 0
+        self.reached_end = False
+        with span("scroll.capture") as record:
+            while count < max_dumps:
+                ui_xml = self._dump(session)
+                if ui_xml is None:
+                    # Move on to the next window rather than end the capture on one bad dump
+                    record["failed_dumps"] = record.get("failed_dumps", 0) + 1
+                    self.swipe_forward(self.distance)
+                    _, current = settled_fingerprint(delay, device)
+                    if current == fingerprint:
+                        self.reached_end = True
+                        break
+                    fingerprint = current
+                    continue
+                digest = hashlib.md5(ui_xml).digest()
+                # Backstop for screens whose pixels never settle (videos, GIFs)
+                if digest == previous_digest:
+                    self.reached_end = True
+                    break
+                previous_digest = digest
+                if count == 0:
+                    self.observe_dump(ui_xml)
+                    self.distance = self.swipe_distance()
+                on_dump(count, ui_xml)
+                count += 1
+                self.swipe_forward(self.distance)
+                _, current = settled_fingerprint(delay, device)
+                if current == fingerprint:
+                    self.reached_end = True
+                    break
+                fingerprint = current
+            record.update(dumps=count, distance=self.distance, reached_end=self.reached_end)
+        if not self.reached_end:
+            logging.warning(f"Stopped after {max_dumps} dumps before reaching the end of the profile")
+        self.last_length = count
+        return count
+
+    def _dump(self, session):
+        """The current screen's XML, or None if uiautomator/adb failed DUMP_ATTEMPTS times."""
+        for attempt in range(DUMP_ATTEMPTS):
+            try:
+                return session.xml()
+            except (subprocess.SubprocessError, OSError) as e:
+                logging.warning(f"UI dump failed (attempt {attempt + 1}/{DUMP_ATTEMPTS}): {e}")
+                session.invalidate()
+        return None
+
+    def scroll_to_top(self, max_swipes=None, settle=4.0):
+        """
+        Swipes back up until a swipe leaves the screen unchanged. The first burst is as many
+        swipes as the last capture went down; after that it goes one swipe at a time.
+        Returns the number of swipes made.
+        """
+        max_swipes = max_swipes or get_setting("scroll.max_top_swipes", DEFAULT_MAX_TOP_SWIPES)
+        device = self.device
+        burst = max(1, self.last_length or 1)
+        # Only the next scroll back follows this profile's length
+        self.last_length = None
+        swipes = 0
+        at_top = False
+        with span("scroll.to_top") as record:
+            previous = screen_fingerprint(device)
+            while swipes < max_swipes:
+                # Back to back: each swipe blocks for its own duration, so only the last one needs to settle
+                for _ in range(min(burst, max_swipes - swipes)):
+                    device.shell(BACK_SWIPE)
+                    swipes += 1
+                _, current = settled_fingerprint(settle, device)
+                if current == previous:
+                    at_top = True
+                    break
+                previous = current
+                burst = 1
+            record.update(swipes=swipes, ok=at_top)
+        if not at_top:
+            logging.warning(f"Screen still moving after {swipes} swipes up")
+        return swipes
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_scroll_controller():
+    """Returns the process-wide scroll controller, creating it on first use."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = ScrollController()
+        return _controller
@@ -0,0 +1,114 @@
+import logging
+import subprocess
+import threading
+from utils.config import get_setting
+from utils.framebuffer import capture_framebuffer
+from utils.history_store import get_history_store
+from utils.interaction_manager import save_profile_hash
+
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 6
+# The first photo of a profile scrolled to the top, as fractions of the screen (left, top, right, bottom)
+DEFAULT_REGION = (0.05, 0.15, 0.95, 0.55)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class HashIndex:
+    """
+    Near-duplicate lookup for 64-bit hashes by multi-index hashing.
+
+    Every hash is split into max_distance + 1 chunks and filed under each chunk's value. Two
+    hashes at most max_distance bits apart must agree exactly on at least one chunk, so a
+    lookup only compares against the hashes sharing a chunk instead of against all of them.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        bounds = [HASH_BITS * i // chunks for i in range(chunks + 1)]
+        self._chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._hashes = set()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, value):
+        return value in self._hashes
+
+    def add(self, value):
+        if value in self._hashes:
+            return
+        self._hashes.add(value)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(value)
+
+    def nearest(self, value):
+        """Returns (hash, distance) of the closest stored hash within max_distance, or None."""
+        if value in self._hashes:
+            return value, 0
+        best = None
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for candidate in table.get((value >> shift) & mask, ()):
+                distance = hamming(value, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (candidate, distance)
+        return best
+
+
+class SeenProfiles:
+    """
+    Recognises profiles the bot has already gone through from a perceptual hash of their first
+    photo, before any UI dump or LLM call is spent on them. Hashes persist in the history store.
+    """
+
+    def __init__(self, store=None, max_distance=None, region=None):
+        self.max_distance = get_setting("seen_profiles.max_distance", DEFAULT_MAX_DISTANCE) \
+            if max_distance is None else max_distance
+        self.region = tuple(region or get_setting("seen_profiles.region", DEFAULT_REGION))
+        self.index = HashIndex(self.max_distance)
+        self._lock = threading.Lock()
+        for value in (store or get_history_store()).profile_hashes():
+            self.index.add(value)
+
+    def fingerprint(self, device=None):
+        """Hash of the profile photo currently on screen, or None if it can't be taken."""
+        try:
+            return capture_framebuffer(device).dhash(self.region)
+        except (ValueError, OSError, subprocess.SubprocessError) as e:
+            logging.debug(f"No profile hash: {e}")
+            return None
+
+    def match(self, value):
+        """Returns the distance to the closest known profile hash, or None if `value` is new."""
+        if value is None:
+            return None
+        with self._lock:
+            found = self.index.nearest(value)
+        return None if found is None else found[1]
+
+    def add(self, value):
+        """Remembers `value` now and queues it for the history store."""
+        if value is None:
+            return
+        with self._lock:
+            known = value in self.index
+            self.index.add(value)
+        if not known:
+            save_profile_hash(value)
+
+
+_seen = None
+_seen_lock = threading.Lock()
+
+
+def get_seen_profiles():
+    """Returns the process-wide seen-profile index, loading stored hashes on first use."""
+    global _seen
+    with _seen_lock:
+        if _seen is None:
+            _seen = SeenProfiles()
+        return _seen
@@ -0,0 +1,93 @@
+import base64
+import logging
+import unicodedata
+from utils.config import get_setting
+from utils.device import get_device
+from utils.metrics import span
+
+ADB_KEYBOARD_IME = "com.android.adbkeyboard/.AdbIME"
+KEYCODE_MOVE_END = 123
+KEYCODE_DEL = 67
+KEYCODE_CTRL_LEFT = 113
+KEYCODE_A = 29
+# Backspaces sent when the field's current text is unknown: more than any draft reply can hold
+MAX_FIELD_CHARS = 300
+# Typographic characters models like to produce, and what `input text` can type instead
+ASCII_REPLACEMENTS = {
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "…": "...", " ": " ",
+}
+
+_ime_active = {}
+
+
+def shell_quote(text):
+    """Quotes `text` as one single-quoted argument for the device shell."""
+    return "'" + text.replace("'", "'\\''") + "'"
+
+
+def to_ascii(text):
+    """Lossy ASCII version of `text` for `input text`: accents stripped, smart quotes straightened."""
+    text = "".join(ASCII_REPLACEMENTS.get(ch, ch) for ch in text)
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def adb_keyboard_active(device=None):
+    """
+    Returns whether ADBKeyboard is the current input method, in which case text goes
+    through its broadcast and any Unicode can be typed. Checked once per device.
+    """
+    device = device or get_device()
+    if get_setting("text_input.adb_keyboard", True) is False:
+        return False
+    key = id(device)
+    if key not in _ime_active:
+        current = device.shell("settings get secure default_input_method")
+        _ime_active[key] = current.strip() == ADB_KEYBOARD_IME
+        if _ime_active[key]:
+            logging.info("ADBKeyboard is the active input method; using it for text entry")
+    return _ime_active[key]
+
+
+def clear_field(field_text="", device=None):
+    """
+    Empties the focused text field in one device round trip: Ctrl+A then delete, or on
+    builds without `input keycombination` (before Android 13), move to the end and send
+    one backspace per character of `field_text` in a single `input keyevent` call.
+    Pass field_text=None when the field's contents are unknown (no dump was taken); the
+    fallback then sends MAX_FIELD_CHARS backspaces.
+    """
+    device = device or get_device()
+    if adb_keyboard_active(device):
+        device.shell("am broadcast -a ADB_CLEAR_TEXT", check=True)
+        return
+    length = MAX_FIELD_CHARS if field_text is None else max(len(field_text), 1)
+    deletes = " ".join([str(KEYCODE_DEL)] * length)
+    device.shell(f"input keycombination {KEYCODE_CTRL_LEFT} {KEYCODE_A} 2>/dev/null && input keyevent {KEYCODE_DEL}"
+                 f" || input keyevent {KEYCODE_MOVE_END} {deletes}", check=True)
+
+
+def type_text(text, device=None):
+    """
+    Types `text` into the focused field with a single device-side call, whatever its length.
+    Raises subprocess.CalledProcessError if the device rejects it.
+    """
+    device = device or get_device()
+    if adb_keyboard_active(device):
+        encoded = base64.b64encode(text.encode("utf-8")).decode("ascii")
+        device.shell(f"am broadcast -a ADB_INPUT_B64 --es msg {encoded}", check=True)
+        return
+    typed = to_ascii(text)
+    if typed != text:
+        logging.warning(f"`input text` can only type ASCII; sending '{typed}' instead of '{text}'. "
+                        f"Install ADBKeyboard and make it the active keyboard to send text unchanged.")
+    # `input text` reads %s as a space; everything else is protected by the quoting
+    device.shell(f"input text {shell_quote(typed.replace(' ', '%s'))}", check=True)
+
+
+def replace_field_text(text, field_text="", device=None):
+    """Clears the focused field (currently holding `field_text`, None if unknown) and types `text` into it."""
+    device = device or get_device()
+    with span("input.replace_text", chars=len(text)):
+        clear_field(field_text, device)
+        type_text(text, device)
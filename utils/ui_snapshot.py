@@ -0,0 +1,212 @@
+import re
+import bisect
+from collections import defaultdict
+from utils import xml_engine
+
+BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+def parse_ui_xml(source):
+    """
+    Returns the root element of a UI dump given as raw XML bytes or as a file path.
+    """
+    return xml_engine.parse(source)
+
+
+class UiSnapshot:
+    """
+    A UI dump parsed once, with lookup tables for the queries the bot runs on every screen.
+
+    Nodes are indexed by class, text, content-desc (exact and by prefix) and clickability,
+    and every node knows its parent, so finding "the clickable parent of the node whose
+    content-desc contains X" no longer re-walks the whole tree per candidate.
+    Text and content-desc keys are stored lowercased; exact-case matching is a filter on top.
+
+    The tables are built on first use. With lxml, query() answers the fixed per-screen
+    lookups with precompiled XPath until they exist, and parents come from the tree itself,
+    so a snapshot that is only queried never builds them at all.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.nodes = list(root.iter("node"))
+        self._parents = None
+        self._indexed = False
+
+    @property
+    def parents(self):
+        """Node -> parent map (ElementTree nodes do not know their parent)."""
+        if self._parents is None:
+            self._parents = {child: parent for parent in self.root.iter() for child in parent}
+        return self._parents
+
+    def _build_index(self):
+        if self._indexed:
+            return
+        self.by_class = defaultdict(list)
+        self.by_text = defaultdict(list)
+        self.by_desc = defaultdict(list)
+        self.clickable = []
+        self._order = {}
+        for i, node in enumerate(self.nodes):
+            attrib = node.attrib
+            self._order[node] = i
+            self.by_class[attrib.get("class", "")].append(node)
+            text = attrib.get("text", "")
+            if text:
+                self.by_text[text.lower()].append(node)
+            desc = attrib.get("content-desc", "")
+            if desc:
+                self.by_desc[desc.lower()].append(node)
+            if attrib.get("clickable") == "true":
+                self.clickable.append(node)
+        self._desc_keys = sorted(self.by_desc)
+        self._indexed = True
+
+    @classmethod
+    def load(cls, source):
+        """Returns `source` if it is already a snapshot, otherwise parses it (XML bytes or file path)."""
+        if isinstance(source, cls):
+            return source
+        return cls(parse_ui_xml(source))
+
+    def index(self, node):
+        """Document-order position of a node."""
+        self._build_index()
+        return self._order[node]
+
+    def parent(self, node):
+        """Returns the parent node, or None for the root."""
+        if xml_engine.etree is not None:
+            return node.getparent()
+        return self.parents.get(node)
+
+    def ancestor(self, node, cls=None, clickable=None):
+        """Returns the nearest ancestor matching the given class and/or clickability."""
+        node = self.parent(node)
+        while node is not None:
+            if self._matches(node, cls=cls, clickable=clickable):
+                return node
+            node = self.parent(node)
+        return None
+
+    def query(self, name, **variables):
+        """
+        Runs one of the named per-screen queries in xml_engine.XPATH_QUERIES and returns the
+        matching nodes in document order (for "texts", the node texts).
+        """
+        xpath = xml_engine.XPATHS.get(name)
+        # Once the lookup tables exist they beat walking the tree again, even in C
+        if xpath is not None and not self._indexed:
+            return xpath(self.root, **variables)
+        if name == "buttons":
+            return self.find_all(cls=variables.get("cls") or None, desc_contains=variables.get("desc") or None,
+                                 clickable=True)
+        if name == "skip_button":
+            return self.find_all(cls="android.widget.Button", desc_prefix="Skip")
+        if name == "input_field":
+            return self.find_all(cls="android.widget.EditText", clickable=True)
+        if name == "send_button":
+            parents = (self.parent(node) for node in self.find_all(desc_contains="send priority like", ignore_case=True))
+            return [parent for parent in parents if parent is not None and parent.attrib.get("clickable") == "true"]
+        if name == "cancel":
+            matches = self.find_all(desc="cancel", ignore_case=True) + self.find_all(text="cancel", ignore_case=True)
+            return sorted(set(matches), key=self.index)
+        if name == "text_nodes":
+            return [node for node in self.nodes if node.attrib.get("text")]
+        if name == "texts":
+            return [node.attrib["text"] for node in self.nodes if "text" in node.attrib]
+        raise KeyError(f"Unknown query '{name}'")
+
+    def _desc_candidates(self, prefix=None, contains=None):
+        if prefix is not None:
+            prefix = prefix.lower()
+            start = bisect.bisect_left(self._desc_keys, prefix)
+            keys = []
+            for key in self._desc_keys[start:]:
+                if not key.startswith(prefix):
+                    break
+                keys.append(key)
+        else:
+            contains = contains.lower()
+            keys = [key for key in self._desc_keys if contains in key]
+        nodes = [node for key in keys for node in self.by_desc[key]]
+        return sorted(nodes, key=self._order.__getitem__) if len(keys) > 1 else nodes
+
+    @staticmethod
+    def _matches(node, cls=None, text=None, desc=None, desc_prefix=None, desc_contains=None,
+                 clickable=None, ignore_case=False):
+        attrib = node.attrib
+        if cls is not None and attrib.get("class") != cls:
+            return False
+        if clickable is not None and (attrib.get("clickable") == "true") != clickable:
+            return False
+        node_text = attrib.get("text", "")
+        node_desc = attrib.get("content-desc", "")
+        if ignore_case:
+            node_text, node_desc = node_text.lower(), node_desc.lower()
+            text = text.lower() if text is not None else None
+            desc = desc.lower() if desc is not None else None
+            desc_prefix = desc_prefix.lower() if desc_prefix is not None else None
+            desc_contains = desc_contains.lower() if desc_contains is not None else None
+        if text is not None and node_text != text:
+            return False
+        if desc is not None and node_desc != desc:
+            return False
+        if desc_prefix is not None and not node_desc.startswith(desc_prefix):
+            return False
+        if desc_contains is not None and desc_contains not in node_desc:
+            return False
+        return True
+
+    def find_all(self, cls=None, text=None, desc=None, desc_prefix=None, desc_contains=None,
+                 clickable=None, ignore_case=False):
+        """
+        Returns all nodes matching every given criterion, in document order.
+        Args:
+            cls (str): Exact `class` attribute.
+            text (str): Exact `text` attribute.
+            desc (str): Exact `content-desc` attribute.
+            desc_prefix (str): `content-desc` starts with this.
+            desc_contains (str): `content-desc` contains this.
+            clickable (bool): Required clickability.
+            ignore_case (bool): Compare text and content-desc case-insensitively.
+        """
+        # Start from the most selective index, then filter on the rest
+        self._build_index()
+        if text is not None:
+            candidates = self.by_text.get(text.lower(), [])
+        elif desc is not None:
+            candidates = self.by_desc.get(desc.lower(), [])
+        elif desc_prefix is not None or desc_contains is not None:
+            candidates = self._desc_candidates(prefix=desc_prefix, contains=desc_contains)
+        elif cls is not None:
+            candidates = self.by_class.get(cls, [])
+        elif clickable:
+            candidates = self.clickable
+        else:
+            candidates = self.nodes
+        return [node for node in candidates
+                if self._matches(node, cls, text, desc, desc_prefix, desc_contains, clickable, ignore_case)]
+
+    def find(self, **criteria):
+        """Returns the first node matching `criteria` (see find_all), or None."""
+        matches = self.find_all(**criteria)
+        return matches[0] if matches else None
+
+    @staticmethod
+    def bounds(node):
+        """Returns (left, top, right, bottom) of a node, or None if its bounds can't be parsed."""
+        match = BOUNDS_RE.match(node.attrib.get("bounds", ""))
+        if match:
+            return tuple(map(int, match.groups()))
+        return None
+
+    @classmethod
+    def center(cls, node):
+        """Returns the (x, y) center of a node, or (None, None) if its bounds can't be parsed."""
+        box = cls.bounds(node)
+        if box is None:
+            return None, None
+        left, top, right, bottom = box
+        return (left + right) // 2, (top + bottom) // 2
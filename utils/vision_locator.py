@@ -0,0 +1,243 @@
+"""
+Finds the fixed-icon controls (Skip, Like, Send) in a raw screencap instead of a UI dump.
+
+A screencap takes a fraction of the time of `uiautomator dump`. Templates are cut from a
+capture taken at bounds a dump has just confirmed, so nothing has to be shipped or drawn by
+hand: the first time a control is needed the dump finds it and its template is saved under
+history/templates. From then on it is located by normalised cross-correlation over a
+downsampled greyscale capture, at a few scales and only within the area the control was seen
+in. Matches below `vision.threshold` fall back to the dump (which also refreshes the template).
+
+Needs NumPy (imported on first use); without it every lookup goes through the dump as before.
+"""
+import os
+import logging
+import subprocess
+import threading
+from utils.config import get_setting
+from utils.framebuffer import capture_framebuffer, get_numpy, CHANNELS
+from utils.metrics import span, count
+
+TEMPLATE_DIR = os.path.join("history", "templates")
+# Captures are matched at 1/DOWNSAMPLE resolution in each direction
+DOWNSAMPLE = 4
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_SCALES = (0.9, 1.0, 1.1)
+# Search area around where each control has been seen, as (horizontal, vertical) fractions
+# of the screen; Like buttons sit on every photo and prompt, so their column is searched in full
+SEARCH_MARGINS = {"skip": (0.05, 0.05), "like": (0.05, 1.0), "send": (0.05, 0.4)}
+DEFAULT_MARGIN = (0.05, 0.1)
+# Controls whose topmost match wins instead of the best one (the first Like on screen, like the dump path)
+TOPMOST = {"like"}
+# Bounds remembered per control for its search area
+MAX_SIGHTINGS = 20
+
+
+def _grey(framebuffer):
+    """Downsampled greyscale (float32) of a capture; the slicing itself copies nothing."""
+    np = get_numpy()
+    pixels = framebuffer.array()[::DOWNSAMPLE, ::DOWNSAMPLE]
+    r, g, b = CHANNELS[framebuffer.pixel_format]
+    return (0.299 * pixels[..., r] + 0.587 * pixels[..., g] + 0.114 * pixels[..., b]).astype(np.float32)
+
+
+def _resize(image, scale):
+    """Nearest-neighbour resize; templates are small, so this costs next to nothing."""
+    np = get_numpy()
+    height = max(2, int(round(image.shape[0] * scale)))
+    width = max(2, int(round(image.shape[1] * scale)))
+    rows = (np.arange(height) * image.shape[0] / height).astype(int)
+    cols = (np.arange(width) * image.shape[1] / width).astype(int)
+    return image[rows][:, cols]
+
+
+def match_template(image, template):
+    """
+    Normalised cross-correlation of `template` at every position inside `image` (both 2-D
+    float arrays). Returns an array of scores in [-1, 1], one per top-left position.
+    """
+    np = get_numpy()
+    th, tw = template.shape
+    if image.shape[0] < th or image.shape[1] < tw:
+        return np.empty((0, 0), dtype=np.float32)
+    t = template - template.mean()
+    t_norm = np.sqrt((t * t).sum())
+    if t_norm == 0:
+        return np.zeros((image.shape[0] - th + 1, image.shape[1] - tw + 1), dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(image, (th, tw))
+    # t is zero-mean, so correlating with the raw windows equals correlating with centred ones
+    numerator = np.einsum("ijkl,kl->ij", windows, t, optimize=True)
+    # Window variances from summed-area tables
+    padded = np.pad(image.astype(np.float64), ((1, 0), (1, 0)))
+    s1 = padded.cumsum(0).cumsum(1)
+    s2 = (padded * padded).cumsum(0).cumsum(1)
+
+    def window_sums(s):
+        return s[th:, tw:] - s[:-th, tw:] - s[th:, :-tw] + s[:-th, :-tw]
+
+    n = th * tw
+    sums = window_sums(s1)
+    variance = np.maximum(window_sums(s2) - sums * sums / n, 0)
+    return (numerator / (np.sqrt(variance) * t_norm + 1e-6)).astype(np.float32)
+
+
+class VisionLocator:
+    """Template store and matcher for the controls in SEARCH_MARGINS."""
+
+    def __init__(self, folder=TEMPLATE_DIR, threshold=None, scales=None, enabled=None):
+        self.folder = folder
+        self.threshold = get_setting("vision.threshold", DEFAULT_THRESHOLD) if threshold is None else threshold
+        self.scales = tuple(scales or get_setting("vision.scales", DEFAULT_SCALES))
+        enabled = get_setting("vision.enabled", True) if enabled is None else enabled
+        self.enabled = bool(enabled) and get_numpy() is not None
+        self._templates = {}
+        self._lock = threading.Lock()
+        if self.enabled:
+            self._load()
+
+    def _load(self):
+        np = get_numpy()
+        if not os.path.isdir(self.folder):
+            return
+        for name in os.listdir(self.folder):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                with np.load(os.path.join(self.folder, name)) as saved:
+                    self._templates[name[:-4]] = {"image": saved["image"], "sightings": saved["sightings"].tolist(),
+                                                  "screen": tuple(saved["screen"].tolist())}
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable template {name}: {e}")
+
+    def _save(self, name, template):
+        np = get_numpy()
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"{name}.npz")
+        np.savez(path, image=template["image"], sightings=np.array(template["sightings"]),
+                 screen=np.array(template["screen"]))
+
+    def has_template(self, name):
+        return name in self._templates
+
+    def forget(self, name):
+        """Drops the template of control `name`, e.g. after a tap on its match changed nothing."""
+        with self._lock:
+            removed = self._templates.pop(name, None)
+        if removed is None:
+            return
+        count("vision.forgotten")
+        logging.info(f"Dropped '{name}' template; it will be learned again from the next dump")
+        try:
+            os.remove(os.path.join(self.folder, f"{name}.npz"))
+        except OSError:
+            pass
+
+    def learn(self, name, bounds, framebuffer=None):
+        """
+        Cuts the template for control `name` from a capture of the current screen, where a dump
+        has just found it at `bounds` (left, top, right, bottom). The screen must not have
+        changed since that dump.
+        """
+        np = get_numpy()
+        if not self.enabled:
+            return False
+        try:
+            framebuffer = framebuffer or capture_framebuffer()
+        except (ValueError, OSError, subprocess.SubprocessError) as e:
+            logging.debug(f"No capture to learn '{name}' from: {e}")
+            return False
+        left, top, right, bottom = (int(v) // DOWNSAMPLE for v in bounds)
+        grey = _grey(framebuffer)
+        image = grey[max(top, 0):bottom, max(left, 0):right]
+        if image.shape[0] < 4 or image.shape[1] < 4 or image.std() < 1:
+            return False
+        screen = (framebuffer.width, framebuffer.height)
+        with self._lock:
+            previous = self._templates.get(name)
+            sightings = previous["sightings"] if previous and previous["screen"] == screen else []
+            sightings = (sightings + [list(map(int, bounds))])[-MAX_SIGHTINGS:]
+            template = {"image": image.astype(np.uint8), "sightings": sightings, "screen": screen}
+            self._templates[name] = template
+        self._save(name, template)
+        logging.info(f"Learned '{name}' template ({image.shape[1] * DOWNSAMPLE}x{image.shape[0] * DOWNSAMPLE}px)")
+        return True
+
+    def _search_box(self, name, template, width, height):
+        sightings = template["sightings"]
+        mx, my = SEARCH_MARGINS.get(name, DEFAULT_MARGIN)
+        left = min(b[0] for b in sightings) - mx * width
+        top = min(b[1] for b in sightings) - my * height
+        right = max(b[2] for b in sightings) + mx * width
+        bottom = max(b[3] for b in sightings) + my * height
+        return (max(0, int(left) // DOWNSAMPLE), max(0, int(top) // DOWNSAMPLE),
+                min(width, int(right)) // DOWNSAMPLE, min(height, int(bottom)) // DOWNSAMPLE)
+
+    def locate(self, name, framebuffer=None):
+        """
+        Returns the screen centre (x, y) of control `name` in a fresh capture, or None when
+        there is no template yet or no match is at least `threshold` confident.
+        """
+        np = get_numpy()
+        if not self.enabled or name not in self._templates:
+            return None
+        with span(f"vision.locate.{name}") as record:
+            try:
+                framebuffer = framebuffer or capture_framebuffer()
+            except (ValueError, OSError, subprocess.SubprocessError) as e:
+                logging.debug(f"Vision locator unavailable: {e}")
+                record["ok"] = False
+                return None
+            template = self._templates[name]
+            if template["screen"] != (framebuffer.width, framebuffer.height):
+                record["ok"] = False
+                return None
+            left, top, right, bottom = self._search_box(name, template, framebuffer.width, framebuffer.height)
+            region = _grey(framebuffer)[top:bottom, left:right]
+            candidates = []
+            for scale in self.scales:
+                image = template["image"].astype(np.float32)
+                if scale != 1.0:
+                    image = _resize(image, scale)
+                scores = match_template(region, image)
+                if scores.size == 0:
+                    continue
+                if name in TOPMOST and (scores >= self.threshold).any():
+                    # The best match within the topmost band that clears the threshold
+                    rows, cols = np.nonzero(scores >= self.threshold)
+                    band = rows <= rows.min() + image.shape[0] // 2
+                    pick = int(np.argmax(scores[rows[band], cols[band]]))
+                    position = (int(rows[band][pick]), int(cols[band][pick]))
+                else:
+                    position = np.unravel_index(int(scores.argmax()), scores.shape)
+                candidates.append((float(scores[position]), position, image.shape))
+            if not candidates:
+                record["ok"] = False
+                return None
+            confident = [c for c in candidates if c[0] >= self.threshold]
+            if name in TOPMOST and confident:
+                best = min(confident, key=lambda c: (c[1][0], -c[0]))
+            else:
+                best = max(candidates, key=lambda c: c[0])
+            score, (row, col), (th, tw) = best
+            record["score"] = round(score, 3)
+            if score < self.threshold:
+                count("vision.fallbacks")
+                record["ok"] = False
+                return None
+            count("vision.hits")
+            x = (left + col + tw / 2) * DOWNSAMPLE
+            y = (top + row + th / 2) * DOWNSAMPLE
+            return int(x), int(y)
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+
+def get_vision_locator():
+    """Returns the process-wide vision locator, loading saved templates on first use."""
+    global _locator
+    with _locator_lock:
+        if _locator is None:
+            _locator = VisionLocator()
+        return _locator
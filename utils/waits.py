@@ -0,0 +1,136 @@
+import time
+import hashlib
+import logging
+from utils.config import get_setting
+from utils.device import get_device
+from utils.screen_session import get_screen_session
+from utils.metrics import span
+
+DEFAULT_POLL_INTERVAL = 0.1
+# Device-side ways to hash a screencap, tried in order until one works on the device
+HASH_COMMANDS = ("screencap | md5sum", "screencap | toybox md5sum", "screencap | cksum")
+# What those print for empty input: screencap produced nothing, so the hash says nothing about the screen
+EMPTY_DIGESTS = ("d41d8cd98f00b204e9800998ecf8427e", "4294967295")
+
+_hash_commands = {}
+
+
+def _poll_interval():
+    return get_setting("waits.poll_interval", DEFAULT_POLL_INTERVAL)
+
+
+def _hash_on_device(device, command):
+    code, output = device.run(command)
+    digest = output.split()[0] if code == 0 and output.strip() else ""
+    return digest if digest and digest not in EMPTY_DIGESTS else None
+
+
+def screen_fingerprint(device=None):
+    """
+    Returns a hash of what is currently on screen. The framebuffer is hashed on the device,
+    so only the digest crosses the wire; the first of HASH_COMMANDS that works is remembered
+    per device. Without any, the raw capture is hashed on the host. Never dumps the UI, which
+    would take seconds per poll.
+    """
+    device = device or get_device()
+    key = id(device)
+    command = _hash_commands.get(key)
+    if command is not None:
+        digest = _hash_on_device(device, command)
+        if digest:
+            return digest
+        del _hash_commands[key]
+    elif key not in _hash_commands:
+        for command in HASH_COMMANDS:
+            digest = _hash_on_device(device, command)
+            if digest:
+                _hash_commands[key] = command
+                return digest
+        logging.warning("No screencap hash command on the device; hashing captures on the host")
+        _hash_commands[key] = None
+    return hashlib.md5(device.exec_out("screencap")).hexdigest()
+
+
+def wait_for_screen_stable(timeout=2.0, device=None):
+    """
+    Polls the screen until two consecutive fingerprints match (scroll or animation finished)
+    or `timeout` seconds pass. Returns True if the screen settled.
+    """
+    return settled_fingerprint(timeout, device)[0]
+
+
+def settled_fingerprint(timeout=2.0, device=None):
+    """
+    Like wait_for_screen_stable, but returns (settled, fingerprint) with the last fingerprint
+    taken, so callers can compare screens without hashing them again.
+
+    A fingerprint is a device round trip of its own, so no poll is started that would end
+    after `timeout`, and the pause between polls only makes up what the round trip didn't.
+    """
+    device = device or get_device()
+    with span("wait.screen_stable", timeout=timeout) as record:
+        start = time.monotonic()
+        deadline = start + timeout
+        previous = screen_fingerprint(device)
+        cost = time.monotonic() - start
+        polls = 1
+        while True:
+            pause = max(0.0, _poll_interval() - cost)
+            if time.monotonic() + pause + cost > deadline:
+                break
+            time.sleep(pause)
+            started = time.monotonic()
+            current = screen_fingerprint(device)
+            cost = time.monotonic() - started
+            polls += 1
+            if current == previous:
+                record["polls"] = polls
+                return True, current
+            previous = current
+        logging.debug(f"Screen still changing after {timeout}s")
+        record.update(ok=False, polls=polls)
+        return False, previous
+
+
+def wait_for_element(timeout=3.0, session=None, **criteria):
+    """
+    Looks for a node matching `criteria` (see UiSnapshot.find_all) in the current screen,
+    re-dumping until it appears or `timeout` seconds pass. Returns (snapshot, node); node is
+    None on timeout and snapshot is the last dump taken, so callers can still look for other
+    elements in it.
+    """
+    session = session or get_screen_session()
+    with span("wait.element", timeout=timeout) as record:
+        deadline = time.monotonic() + timeout
+        # The first look may be answered from the session's cached screen
+        snapshot = session.snapshot()
+        while True:
+            node = snapshot.find(**criteria)
+            if node is not None or time.monotonic() >= deadline:
+                if node is None:
+                    logging.debug(f"No element matching {criteria} after {timeout}s")
+                    record["ok"] = False
+                return snapshot, node
+            time.sleep(_poll_interval())
+            snapshot = session.refresh_snapshot()
+
+
+def keyboard_shown(device=None):
+    """Returns whether the soft keyboard is currently up."""
+    device = device or get_device()
+    output = device.shell("dumpsys input_method | grep mInputShown")
+    return "mInputShown=true" in output
+
+
+def wait_for_keyboard(timeout=2.5, device=None):
+    """Waits until the soft keyboard is shown. Returns False if it did not appear in time."""
+    device = device or get_device()
+    with span("wait.keyboard", timeout=timeout) as record:
+        deadline = time.monotonic() + timeout
+        while not keyboard_shown(device):
+            if time.monotonic() >= deadline:
+                logging.debug(f"Keyboard not shown after {timeout}s")
+                record["ok"] = False
+                return False
+            time.sleep(_poll_interval())
+        return True
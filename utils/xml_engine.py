@@ -0,0 +1,64 @@
+"""
+XML parsing backend shared by every module that reads UI dumps.
+
+lxml is used when it is installed: parsing and parent access run in C, and the
+queries the bot runs on every screen are precompiled XPath expressions (see UiSnapshot.query).
+Without lxml everything falls back to xml.etree.ElementTree with the same results; set
+HINGE_GENIE_XML_ENGINE=etree to use the fallback even when lxml is installed.
+
+lxml is chosen for speed, not memory: a parsed tree lives in libxml2 and takes more resident
+memory than the ElementTree one (see the RSS column of benchmarks/bench_parsing.py).
+"""
+import os
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree
+except ImportError:  # optional; ElementTree is used instead
+    etree = None
+if os.environ.get("HINGE_GENIE_XML_ENGINE", "").lower() == "etree":
+    etree = None
+
+ENGINE = "lxml" if etree is not None else "ElementTree"
+# Catch this instead of ET.ParseError so lxml's syntax errors are covered too
+ParseError = (ET.ParseError,) if etree is None else (ET.ParseError, etree.XMLSyntaxError)
+
+_UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_LOWER = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _lower(attr):
+    return f"translate({attr}, '{_UPPER}', '{_LOWER}')"
+
+
+# Per-screen queries; each has an equivalent UiSnapshot.find_all fallback in ui_snapshot.py
+XPATH_QUERIES = {
+    # Clickable buttons, optionally of one class and with a content-desc containing $desc
+    "buttons": "//node[@clickable='true'][$cls = '' or @class = $cls]"
+               "[$desc = '' or contains(@content-desc, $desc)]",
+    "skip_button": "//node[@class='android.widget.Button'][starts-with(@content-desc, 'Skip')]",
+    "input_field": "//node[@class='android.widget.EditText'][@clickable='true']",
+    "send_button": f"//node[contains({_lower('@content-desc')}, 'send priority like')]/parent::node[@clickable='true']",
+    "cancel": f"//node[{_lower('@content-desc')} = 'cancel' or {_lower('@text')} = 'cancel']",
+    # Every node's text in document order, for prompt extraction
+    "texts": "//node/@text",
+    # Nodes with text, for reading text together with its bounds
+    "text_nodes": "//node[@text != '']",
+}
+
+XPATHS = {name: etree.XPath(query, smart_strings=False) for name, query in XPATH_QUERIES.items()} if etree else {}
+
+if etree is not None:
+    # Dumps come from our own device; no DTDs or entities to resolve
+    _PARSER = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+
+
+def parse(source):
+    """Returns the root element of a UI dump given as raw XML bytes or as a file path."""
+    if etree is not None:
+        if isinstance(source, bytes):
+            return etree.fromstring(source, _PARSER)
+        return etree.parse(source, _PARSER).getroot()
+    if isinstance(source, bytes):
+        return ET.fromstring(source)
+    return ET.parse(source).getroot()